@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+'''
+Created on Jun 20, 2011
+
+@author: bendavies
+'''
+import sys, os, getopt, json, time, random, resource, subprocess
+import critters, strategies, world, plugins, environment as env
+
+#constants
+SIZES = (10, 100, 1000, 10000, 100000)
+RUN_ITERATIONS = 3
+REGRESSION_THRESHOLD = 0.1
+STARTING_FOOD = 500
+MINIMUM_SECONDS = 0.2
+
+
+def build_environment(size, rng):
+    '''
+    creates an environment with size critters, cycling through the strategies
+    and fed well enough that nobody starves while being measured
+    >>> environment = build_environment(12, random.Random(1))
+    >>> len(environment.population)
+    12
+    >>> sorted(environment.strategy_counts.values())
+    [2, 2, 2, 2, 2, 2]
+    '''
+    factories = (strategies.SuckerStrategy, strategies.CheatStrategy,
+                 lambda: strategies.RandomStrategy(1, rng),
+                 lambda: strategies.RandomStrategy(3, rng),
+                 strategies.GrudgerStrategy, strategies.TitForTatStrategy)
+
+    environment = env.Environment()
+    for critter_no in xrange(size):
+        critter = critters.Critter(None, factories[critter_no % len(factories)]())
+        critter.food = STARTING_FOOD
+        environment.add_critter(critter)
+    return environment
+
+
+def bench_determine_interactions(size):
+    '''times pairing the population for one iteration'''
+    xworld = world.PrisonersDilemmaWorld(seed=size)
+    environment = build_environment(size, xworld.random)
+
+    start = time.time()
+    interactions = xworld.determine_interactions(
+        environment.ordered_critters())
+    return time.time() - start, 1, len(interactions)
+
+
+def bench_interact_critters(size):
+    '''times resolving one iteration's interactions pair by pair'''
+    xworld = world.PrisonersDilemmaWorld(seed=size)
+    environment = build_environment(size, xworld.random)
+    interactions = xworld.determine_interactions(
+        environment.ordered_critters())
+
+    start = time.time()
+    for (c1, c2) in interactions:
+        xworld.interact_critters(environment, c1, c2)
+    return time.time() - start, 1, len(interactions)
+
+
+def bench_interact_critters_batch(size):
+    '''times resolving one iteration's interactions as a batch'''
+    xworld = world.PrisonersDilemmaWorld(seed=size, batched=True)
+    environment = build_environment(size, xworld.random)
+    interactions = xworld.determine_interactions(
+        environment.ordered_critters())
+
+    start = time.time()
+    xworld.interact_critters_batch(environment, interactions)
+    return time.time() - start, 1, len(interactions)
+
+
+def bench_end_iteration(size):
+    '''times the environment ending an iteration'''
+    environment = build_environment(size, random.Random(size))
+
+    start = time.time()
+    environment.end_iteration()
+    return time.time() - start, 1, 0
+
+
+def bench_send_event(size):
+    '''times dispatching one event from each of size critters'''
+    population = [critters.Critter(None, None) for critter_no in xrange(size)]
+    listener = critters.Listener()
+    for critter in population:
+        critter.add_listener(listener)
+        critter.add_listener(listener, 'benchmark')
+
+    start = time.time()
+    for critter in population:
+        critter.send_event(critter, 'benchmark', None)
+    return time.time() - start, 1, 0
+
+
+class InteractionCounter(plugins.EventPlugin):
+    '''counts the interactions of a run'''
+
+    def __init__(self):
+        self.interactions = 0
+
+    def on_interactions_end(self, environment, batch):
+        '''counts the iteration's interactions'''
+        self.interactions += len(batch)
+
+
+def bench_run(size):
+    '''times a full PrisonersDilemmaWorld.run of a few iterations'''
+    xworld = world.PrisonersDilemmaWorld(seed=size)
+    xworld.verbose = False
+    counter = InteractionCounter()
+    xworld.add_plugin(counter)
+    environment = build_environment(size, xworld.random)
+
+    start = time.time()
+    xworld.run(RUN_ITERATIONS, environment)
+    return time.time() - start, RUN_ITERATIONS, counter.interactions
+
+
+BENCHMARKS = (('determine_interactions', bench_determine_interactions),
+              ('interact_critters', bench_interact_critters),
+              ('interact_critters_batch', bench_interact_critters_batch),
+              ('end_iteration', bench_end_iteration),
+              ('send_event', bench_send_event),
+              ('run', bench_run))
+
+
+def run_case(name, size):
+    '''
+    runs one benchmark at one population size and returns its result. Fast
+    cases are repeated until they have been measured for MINIMUM_SECONDS.
+    The peak memory growth is how far the case raised the process's peak
+    resident size above what it was before the case, so it only means much
+    in a process that has run nothing else
+    >>> result = run_case('run', 10)
+    >>> result['benchmark'], result['size'], result['iterations'] % 3
+    ('run', 10, 0)
+    >>> result['interactions'] > 0, result['peak_growth_kb'] >= 0
+    (True, True)
+    '''
+    bench = dict(BENCHMARKS)[name]
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = iterations = interactions = 0
+    while seconds < MINIMUM_SECONDS:
+        case_seconds, case_iterations, case_interactions = bench(size)
+        seconds += max(case_seconds, 1e-9)
+        iterations += case_iterations
+        interactions += case_interactions
+    
+    return {'benchmark': name,
+            'size': size,
+            'seconds': seconds,
+            'iterations': iterations,
+            'interactions': interactions,
+            'iterations_per_second': iterations / seconds,
+            'interactions_per_second': interactions / seconds,
+            'peak_growth_kb': 
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - 
+                baseline_kb}
+
+
+def run_isolated(name, size):
+    '''
+    runs one case in a fresh interpreter and returns its result. A forked
+    worker would start with this process's peak resident size, hiding any 
+    growth below it
+    '''
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                '--case', '%s,%d' % (name, size)],
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode != 0:
+        raise RuntimeError('benchmark %s at size %d failed' % (name, size))
+    return json.loads(output)
+
+
+def run_suite(names, sizes):
+    '''
+    runs each benchmark at each size in a fresh interpreter, so that peak 
+    memory growth is that of the case alone
+    '''
+    results = list()
+    for name in names:
+        for size in sizes:
+            result = run_isolated(name, size)
+            print_result(result)
+            results.append(result)
+    return results
+
+
+def current_commit():
+    '''returns the git commit being measured, if there is one'''
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        return process.communicate()[0].strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, results, threshold=REGRESSION_THRESHOLD):
+    '''
+    compares results against a baseline and returns the (benchmark, size,
+    ratio of new to old speed) of every case that slowed by more than 
+    threshold
+    >>> old = [{'benchmark': 'run', 'size': 10, 'iterations_per_second': 3.0}]
+    >>> new = [{'benchmark': 'run', 'size': 10, 'iterations_per_second': 2.0}]
+    >>> compare(old, new) # doctest:+ELLIPSIS
+    [('run', 10, 0.666...)]
+    >>> compare(old, old)
+    []
+    '''
+    previous = dict([((result['benchmark'], result['size']), 
+                      result['iterations_per_second'])
+                     for result in baseline])
+    regressions = list()
+    for result in results:
+        key = (result['benchmark'], result['size'])
+        if key in previous:
+            ratio = result['iterations_per_second'] / previous[key]
+            if ratio < 1 - threshold:
+                regressions.append((key[0], key[1], ratio))
+    return regressions
+
+
+def print_result(result):
+    '''prints a line for a benchmark result'''
+    print '%s\t%d\t%.4fs\t%.1f it/s\t%.0f int/s\t+%d KB peak' % (
+        result['benchmark'], result['size'], result['seconds'],
+        result['iterations_per_second'], result['interactions_per_second'],
+        result['peak_growth_kb'])
+
+
+def main(argv):
+    sizes = SIZES
+    names = [name for (name, bench) in BENCHMARKS]
+    output_path = None
+    baseline_path = None
+    try:
+        opts, args = getopt.getopt(argv, 'hs:b:o:c:',
+                                   ['help', 'sizes=', 'benchmarks=',
+                                    'output=', 'compare=', 'case='])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h','--help'):
+            usage()
+            sys.exit()
+        elif opt in ('-s','--sizes'):
+            sizes = [int(size) for size in arg.split(',')]
+        elif opt in ('-b','--benchmarks'):
+            names = arg.split(',')
+        elif opt in ('-o','--output'):
+            output_path = arg
+        elif opt in ('-c','--compare'):
+            baseline_path = arg
+        elif opt == '--case':
+            #one case, run by run_isolated in a fresh interpreter
+            name, size = arg.split(',')
+            print json.dumps(run_case(name, int(size)))
+            return
+
+    results = run_suite(names, sizes)
+
+    if output_path:
+        output = open(output_path, 'w')
+        try:
+            json.dump({'commit': current_commit(),
+                       'python': sys.version.split()[0],
+                       'results': results}, output, indent=1)
+        finally:
+            output.close()
+
+    if baseline_path:
+        source = open(baseline_path)
+        try:
+            baseline = json.load(source)
+        finally:
+            source.close()
+        regressions = compare(baseline['results'], results)
+        for name, size, ratio in regressions:
+            print 'REGRESSION %s\t%d\t%.2fx the baseline speed' % (name, size,
+                                                                 ratio)
+        if regressions:
+            sys.exit(1)
+
+
+def usage():
+    '''prints usage instructions'''
+    print('Usage: benchmark.py')
+    print('options:')
+    print('-s,sizes\tComma separated population sizes')
+    print('-b,benchmarks\tComma separated benchmarks to run')
+    print('-o,output\tSave the results as JSON')
+    print('-c,compare\tCompare with the JSON results of an earlier run')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
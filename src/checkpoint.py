@@ -0,0 +1,85 @@
+'''
+Created on Jun 14, 2011
+
+@author: bendavies
+'''
+import os, gzip, cPickle
+import critters
+
+#constants
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, world, environment):
+    '''
+    writes a snapshot of a running world to path: the environment with its
+    critters and their strategies, the world's random number generator and
+    the object id counter. Paths ending in .gz are compressed. The snapshot
+    is written to a temporary file first, so an interrupted save never 
+    replaces a good checkpoint. Plugins are not part of the snapshot
+    >>> import tempfile, world, plugins
+    >>> path = tempfile.mktemp()
+    >>> recorder = plugins.StrategyHistoryRecorder()
+    >>> original = world.PrisonersDilemmaWorld(seed=2)
+    >>> original.verbose = False
+    >>> original.add_plugin(recorder)
+    >>> original.checkpoint_path = path
+    >>> original.checkpoint_interval = 20
+    >>> original.run(30)
+    >>> resumed = world.PrisonersDilemmaWorld()
+    >>> resumed.verbose = False
+    >>> resumed_recorder = plugins.StrategyHistoryRecorder()
+    >>> resumed.add_plugin(resumed_recorder)
+    >>> environment = resumed.resume(path)
+    >>> environment.iteration_no
+    20
+    >>> resumed.run(30, environment)
+    >>> resumed_recorder.history == recorder.history[20:]
+    True
+    >>> os.remove(path)
+    '''
+    state = {'version': CHECKPOINT_VERSION,
+             'environment': environment,
+             'random': world.random,
+             'number_of': critters.EnvironmentObject.number_of}
+    
+    temporary_path = '%s.tmp' % path
+    output = open_checkpoint(temporary_path, 'wb', path.endswith('.gz'))
+    try:
+        cPickle.dump(state, output, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        output.close()
+    os.rename(temporary_path, path)
+
+
+def load_checkpoint(path, world):
+    '''
+    reads a snapshot written by save_checkpoint, restores the world's random
+    number generator and the object id counter, and returns the environment
+    '''
+    source = open_checkpoint(path, 'rb', path.endswith('.gz'))
+    try:
+        state = cPickle.load(source)
+    finally:
+        source.close()
+    
+    if state['version'] != CHECKPOINT_VERSION:
+        raise ValueError('unsupported checkpoint version %s' % state['version'])
+    
+    #strategies created by the world share its generator, so keep that object
+    world.random = state['random']
+    critters.EnvironmentObject.number_of = state['number_of']
+    
+    return state['environment']
+
+
+def open_checkpoint(path, mode, compressed):
+    '''opens a checkpoint file'''
+    if compressed:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -12,17 +12,22 @@ def get_new_id():
     determines a new id to assign to an object in the environment
     >>> get_new_id()     # doctest:+ELLIPSIS, +SKIP
     '''
-    EnvironmentObject.number_of += 1
-    return '%s_%d' % (BASE_OBJECT_NAME, EnvironmentObject.number_of)
+    EnvironmentObject.number_of += EnvironmentObject.id_step
+    return EnvironmentObject.number_of
     
 class EnvironmentObject(object):
     '''
     A generic object within the environment. Ages with iterations and
-    can send events
+    can send events. Objects are identified by an integer id; their name is
+    only for display and is built from the id unless one is given
     '''
     
+    __slots__ = ('id', '_name', 'event_listener_map')
+    
     #static variables
     number_of = 0
+    #processes that share critters step ids by the number of processes
+    id_step = 1
   
     def __init__(self, name):
         '''
@@ -31,14 +36,58 @@ class EnvironmentObject(object):
         >>> p = EnvironmentObject('peter')
         >>> p.name 
         'peter'
+        >>> o.name == 'object_%d' % o.id
+        True
+        '''
+        self.id = get_new_id()
+        self._name = name
+        self.event_listener_map = None
+        
+    def get_name(self):
+        '''returns the display name of the object'''
+        return self._name or '%s_%d' % (BASE_OBJECT_NAME, self.id)
+    
+    name = property(get_name)
+        
+    def __getstate__(self):
+        '''
+        returns the object's state for pickling. Listeners are left out; 
+        whoever restores the object re-attaches the ones it needs
+        '''
+        state = dict()
+        for cls in self.__class__.__mro__:
+            for slot in cls.__dict__.get('__slots__', ()):
+                if slot != 'event_listener_map' and hasattr(self, slot):
+                    state[slot] = getattr(self, slot)
+        return state
+    
+    def __setstate__(self, state):
         '''
-        self.name = name if name else get_new_id()
-        self.event_listener_map = dict()
+        restores a pickled object without listeners
+        >>> import cPickle
+        >>> p = EnvironmentObject('peter')
+        >>> p.add_listener(Listener())
+        >>> q = cPickle.loads(cPickle.dumps(p, cPickle.HIGHEST_PROTOCOL))
+        >>> q.name, q.event_listener_map
+        ('peter', None)
+        '''
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.event_listener_map = None
 
     def add_listener(self, listener, event='*'):
         '''
-        Attaches a listener to the object for all or specific events
+        Attaches a listener to the object for all or specific events. The
+        listener map is only created for objects that get listeners
+        >>> o = EnvironmentObject(None)
+        >>> o.event_listener_map is None
+        True
+        >>> o.add_listener(Listener(), 'poked')
+        >>> o.event_listener_map.keys()
+        ['poked']
         '''
+        if self.event_listener_map is None:
+            self.event_listener_map = dict()
         if not self.event_listener_map.has_key(event):
             self.event_listener_map[event] = list()
         self.event_listener_map[event].append(listener)
@@ -48,6 +97,8 @@ class EnvironmentObject(object):
         Dispatches the provided event with the data to registered listeners 
         for that event
         '''
+        if not self.event_listener_map:
+            return
         if self.event_listener_map.has_key(event):
             for listener in self.event_listener_map[event]:
                 listener.receive_event(self, event, data)
@@ -65,15 +116,23 @@ class Listener(object):
 
 class Critter(EnvironmentObject):
     '''
-    An agent within the simulation
+    An agent within the simulation. Food and offspring live on the critter
+    itself unless it is bound to a population store, in which case they live
+    in the store's arrays. The environment hosting the critter is told 
+    directly when it dies or reproduces; listeners are only sent events if 
+    there are any
     '''
     
+    __slots__ = ('_food', '_offspring', 'strategy', 'store', 'index', 
+                 'environment', 'statistics', 'lineage')
+    
     #events
     EVENT_REPRODUCING = 'reproducing'
     EVENT_DYING = 'dying'
     
     #other constants
     FOOD_REQUIRED_TO_REPRODUCE = 1000
+    STARTING_FOOD = 5
 
     def __init__(self, name, strategy):
         '''critter constructor
@@ -87,11 +146,91 @@ class Critter(EnvironmentObject):
         >>> critter2.name
         'c2'
         '''
-        self.food = 5
-        self.offspring = 0
+        self._food = Critter.STARTING_FOOD
+        self._offspring = 0
         self.strategy = strategy
+        self.store = None
+        self.index = None
+        self.environment = None
+        self.statistics = None
+        self.lineage = None
         super(Critter,self).__init__(name)
     
+    def get_name(self):
+        '''
+        returns the display name of the critter. Unnamed offspring are named 
+        after the founder of their line and their own id
+        >>> offspring = Critter(None, None)
+        >>> offspring.lineage = 'c1'
+        >>> offspring.name == 'c1_%d' % offspring.id
+        True
+        '''
+        if self._name:
+            return self._name
+        return '%s_%d' % (self.lineage or BASE_OBJECT_NAME, self.id)
+    
+    name = property(get_name)
+    
+    def get_food(self):
+        '''returns the food held by the critter'''
+        if self.store is None:
+            return self._food
+        return self.store.food[self.index]
+    
+    def set_food(self, food):
+        '''sets the food held by the critter'''
+        if self.statistics is not None:
+            self.statistics.food += food - self.food
+        if self.store is None:
+            self._food = food
+        else:
+            self.store.food[self.index] = food
+    
+    food = property(get_food, set_food)
+    
+    def get_offspring(self):
+        '''returns the number of offspring the critter has had'''
+        if self.store is None:
+            return self._offspring
+        return self.store.offspring[self.index]
+    
+    def set_offspring(self, offspring):
+        '''sets the number of offspring the critter has had'''
+        if self.store is None:
+            self._offspring = offspring
+        else:
+            self.store.offspring[self.index] = offspring
+    
+    offspring = property(get_offspring, set_offspring)
+    
+    def bind(self, store):
+        '''
+        Moves the critter's state into a population store
+        >>> import strategies, population
+        >>> store = population.PopulationStore()
+        >>> critter = Critter('c1', strategies.CheatStrategy())
+        >>> critter.bind(store)
+        >>> critter.add_food(10)
+        >>> store.food[critter.index]
+        15
+        >>> critter.unbind()
+        >>> critter.food, len(store)
+        (15, 0)
+        '''
+        self.index = store.add(self.id, self.strategy.short_name,
+                               self._food, self._offspring)
+        self.store = store
+    
+    def unbind(self):
+        '''
+        Takes the critter's state back out of its population store
+        '''
+        self._food = self.food
+        self._offspring = self.offspring
+        self.store.remove(self.id)
+        self.store = None
+        self.index = None
+    
     def interact(self, other_critter):
         '''Interact with another critter
         >>> from strategies import CheatStrategy, SuckerStrategy
@@ -116,15 +255,30 @@ class Critter(EnvironmentObject):
     
     def add_food(self, food_amount):
         '''
-        Adds food to the critter
+        Adds food to the critter. A critter with more food than its 
+        environment requires to reproduce reproduces
         >>> critter = Critter(None, None)
         >>> critter.add_food(10)
         >>> critter.food
         15
         '''
-        self.food += food_amount
+        store = self.store
+        if store is None:
+            self._food += food_amount
+            food = self._food
+        else:
+            food = store.food[self.index] + food_amount
+            store.food[self.index] = food
         
-        if self.food > Critter.FOOD_REQUIRED_TO_REPRODUCE:
+        if self.statistics is not None:
+            self.statistics.food += food_amount
+        
+        environment = self.environment
+        if environment is None:
+            required = Critter.FOOD_REQUIRED_TO_REPRODUCE
+        else:
+            required = environment.food_required_to_reproduce
+        if food > required:
             self.reproduce()
     
     def remove_food(self, food_amount):
@@ -135,11 +289,23 @@ class Critter(EnvironmentObject):
         >>> critter.food
         -5
         '''      
-        self.food -= food_amount
+        store = self.store
+        if store is None:
+            self._food -= food_amount
+            food = self._food
+        else:
+            food = store.food[self.index] - food_amount
+            store.food[self.index] = food
+        
+        if self.statistics is not None:
+            self.statistics.food -= food_amount
         
-        if self.food <= 0:
-            self.send_event(self, Critter.EVENT_DYING, 
-                            {'cause':'starvation'})
+        if food <= 0:
+            if self.environment is not None:
+                self.environment.queue_death(self)
+            if self.event_listener_map:
+                self.send_event(self, Critter.EVENT_DYING, 
+                                {'cause':'starvation'})
 
     def reproduce(self):
         '''
@@ -151,12 +317,18 @@ class Critter(EnvironmentObject):
         
         #update this critter
         self.offspring += 1
-        self.remove_food(Critter.FOOD_REQUIRED_TO_REPRODUCE)
-        offspring_name = '%s_%d' % (self.name, self.offspring)
-        offspring = (Critter(offspring_name, self.strategy.create_new()))
+        if self.environment is None:
+            self.remove_food(Critter.FOOD_REQUIRED_TO_REPRODUCE)
+        else:
+            self.remove_food(self.environment.food_required_to_reproduce)
+        offspring = (Critter(None, self.strategy.create_new()))
+        offspring.lineage = self._name or self.lineage
         
-        self.send_event(self, Critter.EVENT_REPRODUCING, 
-                        {'offspring':offspring})
+        if self.environment is not None:
+            self.environment.queue_birth(self, offspring)
+        if self.event_listener_map:
+            self.send_event(self, Critter.EVENT_REPRODUCING, 
+                            {'offspring':offspring})
         
         return offspring
 
@@ -3,44 +3,444 @@ Created on May 25, 2011
 
 @author: bendavies
 '''
+import random, heapq
 import critters, strategies
 
 #constants
     
 ITERATION_FOOD_CONSUMPTION = 3
 
+#how critters are chosen to be culled from a population over capacity
+CULL_RANDOM = 'random'
+CULL_LOWEST_FOOD = 'lowest_food'
+CULL_OLDEST = 'oldest'
+CULL_POLICIES = (CULL_RANDOM, CULL_LOWEST_FOOD, CULL_OLDEST)
+
 FOOD_REQUIRED_TO_REPRODUCE = 150
 
 
+class StrategyStatistics(object):
+    '''
+    Live totals for the critters of one strategy in an environment, kept up
+    to date as critters arrive, eat and leave
+    '''
+    
+    __slots__ = ('name', 'alive', 'food', 'births', 'deaths')
+    
+    def __init__(self, name):
+        self.name = name
+        self.alive = 0
+        self.food = 0
+        self.births = 0
+        self.deaths = 0
+        
+    def __getstate__(self):
+        return (self.name, self.alive, self.food, self.births, self.deaths)
+    
+    def __setstate__(self, state):
+        self.name, self.alive, self.food, self.births, self.deaths = state
+        
+
 class Environment(object):
     '''Hosts all of the objects in the simulation'''
     
-    def __init__(self):
+    def __init__(self, store=None, memory=None, topology=None):
         '''
-        Initialises the environment
+        Initialises the environment. If a population store is provided the
+        critters keep their state in it while they are in the environment.
+        If a pairwise memory is provided, reactive strategies remember their
+        partners in it rather than in their own containers. If a topology
+        is provided, every critter is placed in it, offspring near their
+        parents, and critters that cannot be placed are not added. Critters
+        consume food_consumption food every iteration and reproduce once they
+        hold more than food_required_to_reproduce. If there is a capacity,
+        critters beyond it are culled at the end of every iteration by the
+        cull policy, drawing from rng if the policy is random.
+        
+        Births and deaths are queued as they happen and applied together at
+        the end of the iteration, so the population never changes while it is
+        being walked. Besides the population dict, keyed by id, the critters
+        are kept in a list in the order they joined (see ordered_critters), 
+        and the critters with names given to them are kept by name
         Usage:
         >>> env = Environment()
         '''
         self.iteration_no = 0
         self.population = dict()
-        self.strategy_counts = dict()
+        self.order = list()
+        self.stale = 0
+        self.named = dict()
+        self.strategy_stats = dict()
+        self.store = store
+        self.memory = memory
+        self.topology = topology
+        self.food_consumption = ITERATION_FOOD_CONSUMPTION
+        self.food_required_to_reproduce = (
+            critters.Critter.FOOD_REQUIRED_TO_REPRODUCE)
+        self.capacity = None
+        self.cull_policy = CULL_RANDOM
+        self.rng = random
+        self.culled = 0
+        self.departed = set()
+        self.births = 0
+        self.deaths = 0
+        self.born = list()
+        self.dying = list()
+     
+    def get_strategy_counts(self):
+        '''
+        returns a dict of the number of living critters by strategy name
+        >>> e = Environment()
+        >>> e.add_critter(critters.Critter('c1', strategies.CheatStrategy()))
+        >>> e.strategy_counts
+        {'CHT': 1}
+        '''
+        return dict([(name, statistics.alive) 
+                     for name, statistics in self.strategy_stats.items()])
+    
+    strategy_counts = property(get_strategy_counts)
+    
+    def strategy_totals(self):
+        '''
+        returns dicts of living critter count and food total by strategy name
+        >>> e = Environment()
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critters((cheater, critters.Critter('s1', strategies.SuckerStrategy())))
+        >>> cheater.add_food(10)
+        >>> cheater.remove_food(16)
+        >>> e.end_iteration()
+        >>> counts, food = e.strategy_totals()
+        >>> sorted(counts.items()), sorted(food.items())
+        ([('CHT', 0), ('SCK', 1)], [('CHT', 0), ('SCK', 2)])
+        >>> e.strategy_stats['CHT'].deaths
+        1
+        '''
+        counts = dict()
+        food = dict()
+        for name, statistics in self.strategy_stats.items():
+            counts[name] = statistics.alive
+            food[name] = statistics.food
+        return counts, food
+     
+    def ordered_critters(self):
+        '''
+        returns the living critters in the order they joined the environment.
+        Unlike the order of the population dict, this does not depend on the
+        values of the ids, so seeded runs walk their population the same way
+        wherever they run. Critters that have left are dropped from the list
+        in one pass the next time it is asked for; the list returned must not
+        be changed
+        >>> e = Environment()
+        >>> cheaters = [critters.Critter(None, strategies.CheatStrategy())
+        ...             for i in range(4)]
+        >>> e.add_critters(reversed(cheaters))
+        >>> e.remove_critter(cheaters[1]) is not None
+        True
+        >>> [cheaters.index(critter) for critter in e.ordered_critters()]
+        [3, 2, 0]
+        >>> e.add_critter(cheaters[1])
+        >>> [cheaters.index(critter) for critter in e.ordered_critters()]
+        [3, 2, 0, 1]
+        '''
+        if self.stale:
+            self.compact_order()
+        return self.order
+    
+    def compact_order(self):
+        '''drops the critters that have left from the order list'''
+        self.order = [critter for critter in self.order 
+                      if critter.environment is self]
+        self.stale = 0
      
     def start_iteration(self):
         self.iteration_no += 1
 
     def end_iteration(self):
         '''
-        Ends the iteration and forces all critters to consume food
+        Ends the iteration: the iteration's offspring join the population, all
+        critters consume food, the starved are removed, critters beyond the
+        capacity are culled, and critters that remember others forget those
+        that have left
+        >>> e = Environment()
+        >>> grudger = critters.Critter('g1', strategies.GrudgerStrategy())
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critters((grudger, cheater))
+        >>> grudger.observe_interaction(grudger, 1, cheater, 0)
+        >>> cheater.food = 1
+        >>> e.end_iteration()
+        >>> grudger.strategy.agents_to_grudge
+        set([])
+        >>> len(e.population), e.deaths
+        (1, 1)
         '''
         
+        if self.born:
+            self.add_births()
+        
         #all critters consume food
+        food_consumption = self.food_consumption
+        for critter in self.ordered_critters():
+            critter.remove_food(food_consumption)                
+        
+        if self.dying:
+            self.remove_deaths()
+        
+        if self.capacity is not None and len(self.population) > self.capacity:
+            self.cull(len(self.population) - self.capacity)
+        
+        if self.departed:
+            self.forget_departed()
+        
+    def queue_birth(self, parent, offspring):
+        '''
+        Queues an offspring to join the environment at the end of the iteration
+        >>> e = Environment()
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critter(cheater)
+        >>> cheater.add_food(critters.Critter.FOOD_REQUIRED_TO_REPRODUCE)
+        >>> len(e.population), len(e.born)
+        (1, 1)
+        >>> e.end_iteration()
+        >>> sorted([critter.name for critter in e.population.values()]) # doctest:+ELLIPSIS
+        ['c1', 'c1_...']
+        '''
+        self.born.append((parent, offspring))
+    
+    def queue_death(self, critter):
+        '''
+        Queues a critter to leave the environment at the end of the iteration
+        '''
+        self.dying.append(critter)
+        
+    def add_births(self):
+        '''
+        Adds the queued offspring to the population, next to their parents 
+        if there is a topology. An offspring the topology has no room for is
+        never born, and its parent gets back the food it paid for it
+        >>> import topology
+        >>> e = Environment(topology=topology.Lattice(2, 1))
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critter(cheater)
+        >>> cheater.add_food(critters.Critter.FOOD_REQUIRED_TO_REPRODUCE * 2)
+        >>> e.add_births()
+        >>> len(e.population), e.births
+        (2, 1)
+        >>> food = cheater.food
+        >>> cheater.add_food(critters.Critter.FOOD_REQUIRED_TO_REPRODUCE)
+        >>> e.add_births()
+        >>> len(e.population), e.births, cheater.offspring
+        (2, 1, 1)
+        >>> cheater.food - food == critters.Critter.FOOD_REQUIRED_TO_REPRODUCE
+        True
+        '''
+        born = self.born
+        self.born = list()
+        for parent, critter in born:
+            self.add_critter(critter, parent)
+            if critter.environment is self:
+                self.births += 1
+                critter.statistics.births += 1
+            else:
+                parent.offspring -= 1
+                parent.food += self.food_required_to_reproduce
+    
+    def remove_deaths(self):
+        '''Removes the queued dead critters from the population in one pass'''
+        dying = self.dying
+        self.dying = list()
+        
+        for critter in dying:
+            statistics = self.remove_critter(critter)
+            if statistics is not None:
+                statistics.deaths += 1
+                self.deaths += 1
+    
+    def cull(self, count):
+        '''
+        Removes count critters chosen by the cull policy straight away, 
+        counting them as deaths
+        >>> e = Environment()
+        >>> e.capacity, e.cull_policy = 2, CULL_LOWEST_FOOD
+        >>> for food in (7, 3, 9, 1):
+        ...     critter = critters.Critter(None, strategies.CheatStrategy())
+        ...     critter.food = food + ITERATION_FOOD_CONSUMPTION
+        ...     e.add_critter(critter)
+        >>> e.end_iteration()
+        >>> sorted([critter.food for critter in e.population.values()])
+        [7, 9]
+        >>> e.culled, e.deaths, e.strategy_stats['CHT'].deaths
+        (2, 2, 2)
+        '''
+        for critter in self.select_cull(count):
+            statistics = self.remove_critter(critter)
+            statistics.deaths += 1
+            self.deaths += 1
+            self.culled += 1
+    
+    def select_cull(self, count):
+        '''
+        returns count critters to cull, picked by the cull policy: a random
+        sample, the critters with the least food or the oldest critters, ie
+        those with the smallest ids. Only the chosen critters are ordered, 
+        not the population, and with a population store the food is read 
+        from its array. Ties are broken by id, so a compact environment
+        culls the same critters
+        >>> import population
+        >>> for store in (None, population.PopulationStore()):
+        ...     e = Environment(store)
+        ...     e.cull_policy = CULL_LOWEST_FOOD
+        ...     cheaters = [critters.Critter(None, strategies.CheatStrategy())
+        ...                 for i in range(4)]
+        ...     e.add_critters(cheaters)
+        ...     cheaters[0].food = 9
+        ...     print [cheaters.index(critter) for critter in e.select_cull(2)]
+        [1, 2]
+        [1, 2]
+        >>> e.cull_policy = CULL_OLDEST
+        >>> [cheaters.index(critter) for critter in e.select_cull(3)]
+        [0, 1, 2]
+        >>> e.cull_policy = CULL_RANDOM
+        >>> len(set(e.select_cull(3)))
+        3
+        
+        a random cull samples the critters in the order they joined, which
+        the environment keeps as they come and go, so it depends on the 
+        generator's state and not on the values of the ids
+        >>> def random_cull(offset):
+        ...     critters.EnvironmentObject.number_of = offset
+        ...     e = Environment()
+        ...     e.rng = random.Random(3)
+        ...     cheaters = [critters.Critter(None, strategies.CheatStrategy())
+        ...                 for i in range(50)]
+        ...     e.add_critters(cheaters)
+        ...     return [cheaters.index(critter) for critter in e.select_cull(5)]
+        >>> random_cull(0) == random_cull(1000)
+        True
+        
+        and culling an environment over capacity never sorts its population
+        >>> import __builtin__
+        >>> def no_sorting(*args, **kwargs):
+        ...     raise AssertionError('the population was sorted')
+        >>> e = Environment()
+        >>> e.capacity, e.rng = 10, random.Random(1)
+        >>> e.add_critters([critters.Critter(None, strategies.SuckerStrategy())
+        ...                 for i in range(50)])
+        >>> __builtin__.sorted, real_sorted = no_sorting, __builtin__.sorted
+        >>> try:
+        ...     e.end_iteration()
+        ... finally:
+        ...     __builtin__.sorted = real_sorted
+        >>> len(e.population), e.culled
+        (10, 40)
+        '''
+        population = self.population
+        policy = self.cull_policy
+        if policy == CULL_RANDOM:
+            return self.rng.sample(self.ordered_critters(), count)
+        elif policy == CULL_OLDEST:
+            return [population[critter_id] 
+                    for critter_id in heapq.nsmallest(count, population)]
+        elif policy == CULL_LOWEST_FOOD:
+            store = self.store
+            if store is None:
+                return heapq.nsmallest(count, population.itervalues(), 
+                                       key=lambda critter: (critter.food, 
+                                                            critter.id))
+            food, ids, alive = store.food, store.ids, store.alive
+            indexes = heapq.nsmallest(count, 
+                                      [index for index in xrange(len(food)) 
+                                       if alive[index]],
+                                      key=lambda index: (food[index], 
+                                                         ids[index]))
+            return [population[ids[index]] for index in indexes]
+        raise ValueError('unknown cull policy %s' % policy)
+    
+    def remove_critter(self, critter):
+        '''
+        Removes a living critter from the environment straight away, without
+        counting it as a death, and returns the statistics of its strategy. 
+        Returns None if the critter was not in the environment
+        >>> e = Environment()
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critter(cheater)
+        >>> e.remove_critter(cheater).alive, e.remove_critter(cheater)
+        (0, None)
+        '''
+        if self.population.pop(critter.id, None) is None:
+            return None
+        self.stale += 1
+        if critter._name is not None:
+            self.named.pop(critter._name, None)
+        self.departed.add(critter.id)
+        if self.topology is not None:
+            self.topology.remove(critter)
+        critter.environment = None
+        statistics = critter.statistics
+        statistics.alive -= 1
+        statistics.food -= critter.food
+        critter.statistics = None
+        if critter.store is not None:
+            critter.unbind()
+        return statistics
+        
+    def find_critter(self, name):
+        '''
+        returns the living critter with the given display name, if any. 
+        Critters with given names are looked up by name, others by the id 
+        their name ends in, so no critters are walked
+        >>> e = Environment()
+        >>> cheater = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critter(cheater)
+        >>> cheater.food = critters.Critter.FOOD_REQUIRED_TO_REPRODUCE * 2
+        >>> offspring = cheater.reproduce()
+        >>> e.end_iteration()
+        >>> e.find_critter('c1').name, e.find_critter('c2')
+        ('c1', None)
+        >>> e.find_critter(offspring.name) is offspring
+        True
+        >>> e.find_critter('c2_%d' % offspring.id)
+        '''
+        critter = self.named.get(name)
+        if critter is None:
+            head, separator, tail = name.rpartition('_')
+            if separator and tail.isdigit():
+                critter = self.population.get(int(tail))
+                if critter is not None and critter.name != name:
+                    critter = None
+        return critter
+        
+    def forget_departed(self):
+        '''
+        Tells critters that remember others about the critters that have left
+        the environment since this was last called. Entries of the pairwise 
+        memory are dropped in bulk
+        >>> e = Environment(memory=strategies.PairwiseMemory())
+        >>> t1 = critters.Critter('t1', strategies.TitForTatStrategy())
+        >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
+        >>> e.add_critters((t1, c1))
+        >>> e.memory.record(t1.id, c1.id, strategies.UNCOOPERATE)
+        >>> e.queue_death(c1)
+        >>> e.remove_deaths()
+        >>> e.forget_departed()
+        >>> len(e.memory)
+        0
+        '''
+        departed = self.departed
+        memory = self.memory
+        if memory is not None:
+            memory.forget(departed, len(self.population))
         for critter in self.population.values():
-            critter.remove_food(ITERATION_FOOD_CONSUMPTION)                
+            strategy = critter.strategy
+            if strategy.remembers and (memory is None or 
+                                       strategy.reactions is None):
+                strategy.forget(departed)
+        self.departed = set()
         
         
-    def add_critter(self, critter):
+    def add_critter(self, critter, near=None):
         '''
-        Adds a critter to the environment
+        Adds a critter to the environment, placing it in the topology if
+        there is one, as close to the critter near as possible
         
         >>> e = Environment()
         >>> sucker = critters.Critter('s1', strategies.SuckerStrategy())
@@ -48,17 +448,37 @@ class Environment(object):
         >>> e.add_critter(sucker)
         >>> len(e.population.values())
         1
+        >>> import population
+        >>> e = Environment(population.PopulationStore())
+        >>> e.add_critters((sucker, cheater))
+        >>> len(e.store)
+        2
         '''
         
-        if not self.population.has_key(critter.name):
-            self.population[critter.name] = critter
-            critter.add_listener(self)
+        if not self.population.has_key(critter.id):
+            if (self.topology is not None and 
+                not self.topology.place(critter, near)):
+                return
+            if self.stale:
+                #the critter may be rejoining, still listed from before
+                self.compact_order()
+            self.population[critter.id] = critter
+            self.departed.discard(critter.id)
+            self.order.append(critter)
+            if critter._name is not None:
+                self.named[critter._name] = critter
+            critter.environment = self
+            if self.store is not None:
+                critter.bind(self.store)
         
-        strategy = critter.strategy.short_name        
-        if strategy not in self.strategy_counts:
-            self.strategy_counts[strategy] = 1
-        else:
-            self.strategy_counts[strategy] += 1 
+            strategy = critter.strategy.short_name
+            statistics = self.strategy_stats.get(strategy)
+            if statistics is None:
+                statistics = StrategyStatistics(strategy)
+                self.strategy_stats[strategy] = statistics
+            statistics.alive += 1
+            statistics.food += critter.food
+            critter.statistics = statistics
     
     def add_critters(self, critter_list):
         '''
@@ -69,15 +489,17 @@ class Environment(object):
     
     def receive_event(self, source, event, data):
         '''
-        Receive an event being listened for
+        Receive an event being listened for. Critters in the environment 
+        report to it directly, but it can also listen to other objects
         '''
         if event == critters.Critter.EVENT_DYING:
-            # a critter has died, remove him from the list
-            del self.population[source.name]
+            # a critter has died, remove him at the end of the iteration
+            self.queue_death(source)
             
         elif event == critters.Critter.EVENT_REPRODUCING:
-            # a critter has reproduced, add the offspring to the list
-            self.add_critter(data['offspring'])
+            # a critter has reproduced, add the offspring at the end of the 
+            # iteration
+            self.queue_birth(source, data['offspring'])
             
         else:
             print 'Received unknown event "%s"' % event
@@ -4,14 +4,40 @@ Created on May 15, 2011
 
 @author: ben
 '''
-import sys, getopt, world, plugins
+import sys, getopt, world, plugins, runner, profiling, pairing, sharding
+import stopping
+import environment as env
 
 def main(argv):
     world_to_run = 'PrisonersDilemma'
     track_critter = None
     iterations = 15
+    batched = False
+    compact = False
+    shared_memory = False
+    pairing_engine = None
+    shards = None
+    report_interval = 5
+    runs = 1
+    seed = None
+    processes = None
+    metrics_path = None
+    checkpoint_path = None
+    checkpoint_interval = None
+    resume_path = None
+    profile = False
+    stopping_conditions = None
+    capacity = None
+    cull_policy = env.CULL_RANDOM
     try:
-        opts, args = getopt.getopt(argv, 'ht:i:','--help,--track,--iterations')
+        opts, args = getopt.getopt(argv, 'ht:i:bcr:s:p:m:k:g:e:',
+                                   ['help', 'track=', 'iterations=', 'batch',
+                                    'compact', 'runs=', 'seed=', 
+                                    'processes=', 'metrics=', 'checkpoint=',
+                                    'checkpoint-every=', 'resume=', 
+                                    'profile', 'shared-memory', 'grid=',
+                                    'shards=', 'every=', 'stop-stable=',
+                                    'capacity=', 'cull='])
         
     except getopt.GetoptError:
         usage()
@@ -24,26 +50,165 @@ def main(argv):
             track_critter = arg
         elif opt in ('-i','--iterations'):
             iterations = int(arg)
+        elif opt in ('-b','--batch'):
+            batched = True
+        elif opt in ('-c','--compact'):
+            compact = True
+        elif opt in ('-r','--runs'):
+            runs = int(arg)
+        elif opt in ('-s','--seed'):
+            seed = int(arg)
+        elif opt in ('-p','--processes'):
+            processes = int(arg)
+        elif opt in ('-m','--metrics'):
+            metrics_path = arg
+        elif opt in ('-k','--checkpoint'):
+            checkpoint_path = arg
+        elif opt == '--checkpoint-every':
+            checkpoint_interval = int(arg)
+        elif opt == '--resume':
+            resume_path = arg
+        elif opt == '--profile':
+            profile = True
+        elif opt == '--shared-memory':
+            shared_memory = True
+        elif opt in ('-g','--grid'):
+            width, height = [int(size) for size in arg.split('x')]
+            pairing_engine = pairing.LatticePairing(width, height)
+        elif opt == '--shards':
+            shards = int(arg)
+        elif opt in ('-e','--every'):
+            report_interval = int(arg)
+            if report_interval < 1:
+                usage()
+                sys.exit(2)
+        elif opt == '--stop-stable':
+            stopping_conditions = stopping.default_conditions(int(arg))
+        elif opt == '--capacity':
+            capacity = int(arg)
+        elif opt == '--cull':
+            if arg not in env.CULL_POLICIES:
+                usage()
+                sys.exit(2)
+            cull_policy = arg
             
     world_to_run = "".join(args) or world_to_run
     
     print "running world %s" % world_to_run
     
+    options = {'batched': batched, 'compact': compact, 
+               'shared_memory': shared_memory, 
+               'pairing_engine': pairing_engine}
+    if stopping_conditions:
+        options['stopping_conditions'] = stopping_conditions
+    if capacity is not None:
+        options['config'] = world.WorldConfig(capacity=capacity, 
+                                              cull_policy=cull_policy)
+    if runs > 1:
+        run_batch(runs, iterations, seed or 0, processes, options)
+        return
+    if shards:
+        run_sharded(shards, iterations, seed or 0, options)
+        return
+    
     xworld = instantiate_world(world_to_run)
-    xworld.add_plugin(plugins.StrategyTabularReporter())
+    xworld.batched = batched
+    xworld.compact = compact
+    xworld.shared_memory = shared_memory
+    if pairing_engine:
+        xworld.pairing_engine = pairing_engine
+    if stopping_conditions:
+        xworld.stopping_conditions = stopping_conditions
+    if capacity is not None:
+        xworld.config = xworld.config.replace(capacity=capacity, 
+                                              cull_policy=cull_policy)
+    if seed is not None:
+        xworld.random.seed(seed)
+    if checkpoint_path:
+        xworld.checkpoint_path = checkpoint_path
+        if checkpoint_interval:
+            xworld.checkpoint_interval = checkpoint_interval
+    xworld.add_plugin(plugins.StrategyTabularReporter(report_interval))
     
     if track_critter:
         xworld.add_plugin(plugins.CritterTracker(track_critter))
-    xworld.run(iterations) 
+    if metrics_path:
+        fmt = metrics_path.endswith('.csv') and 'csv' or 'binary'
+        xworld.add_plugin(plugins.MetricsSink(metrics_path, fmt))
+    if profile:
+        xworld.stats = profiling.RunStats()
+    
+    environment = None
+    if resume_path:
+        environment = xworld.resume(resume_path)
+    xworld.run(iterations, environment) 
+    
+    if profile:
+        print xworld.stats.report()
     
+def run_batch(runs, iterations, seed, processes, options):
+    '''
+    runs many independent worlds over a process pool and summarises them.
+    Runs that recorded no iteration have no counts to show
+    >>> run_batch(2, 0, 1, 1, dict()) # doctest:+NORMALIZE_WHITESPACE
+    seed:
+    1:
+    2:
+    '''
+    specs = runner.make_specs(runs, iterations, seed, options)
+    results = runner.BatchRunner(processes).run(specs)
     
+    strategies = sorted(set([strategy for result in results 
+                             for strategy in result.final_counts()]))
+    print 'seed:\t%s' % '\t'.join(strategies)
+    for result in results:
+        final_counts = result.final_counts()
+        print '%d:\t%s' % (result.spec.seed, '\t'.join(
+                ['%d' % final_counts.get(strategy, 0) 
+                 for strategy in strategies]))
+        if result.stop_reason is not None and result.history:
+            print '\tstopped after iteration %d: %s' % (
+                result.history[-1][0], result.stop_reason)
+
+def run_sharded(shards, iterations, seed, options):
+    '''runs one world split into shards over processes and summarises it'''
+    sharded = sharding.ShardedWorld(shards, seed, options)
+    history = sharded.run(iterations)
+
+    strategies = sharded.strategy_names
+    print 'iteration:\t%s' % '\t'.join(strategies)
+    for iteration_no, counts, food in history:
+        print '%d:\t%s' % (iteration_no, '\t'.join(
+                ['%d' % counts[strategy] for strategy in strategies]))
+    print 'births: %d deaths: %d' % (sharded.births, sharded.deaths)
+
 
 def usage():
     '''prints usage instructions'''
     print('Usage: main.py [world]')
     print('options:')
     print('-i,iterations\tNumber of iterations to run')
-    print('-t,track\ttrack a named critter')        
+    print('-e,every\tReport the strategies every this many iterations '
+          '(at least 1)')
+    print('-t,track\ttrack a named critter')
+    print('-b,batch\tresolve each iteration\'s interactions as one batch')
+    print('-c,compact\tkeep critter state in a compact population store')
+    print('-r,runs\tNumber of independent runs to spread over processes')
+    print('-s,seed\tSeed of the (first) run')
+    print('-p,processes\tNumber of processes for multiple runs')
+    print('-m,metrics\tStream per-iteration metrics to a file (.csv for CSV)')
+    print('-k,checkpoint\tCheckpoint the world to a file (.gz to compress)')
+    print('--checkpoint-every\tIterations between checkpoints')
+    print('--resume\tResume the world from a checkpoint file')
+    print('--profile\tTime each phase of the iterations and report it')
+    print('--shared-memory\tKeep reactive strategies\' memories in one '
+          'pairwise memory')
+    print('-g,grid\tPair neighbours on a WIDTHxHEIGHT grid')
+    print('--shards\tSplit one world into shards run by this many processes')
+    print('--stop-stable\tStop once extinct, down to one strategy or with '
+          'shares unchanged for this many iterations (0: never on shares)')
+    print('--capacity\tCull critters beyond this population')
+    print('--cull\tWho is culled: %s' % ', '.join(env.CULL_POLICIES))
 
 def instantiate_world(name_of_world):
     '''instantiates the named world (class = world.[name_of_world]World)'''
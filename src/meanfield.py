@@ -0,0 +1,349 @@
+'''
+Created on Jul 4, 2011
+
+@author: bendavies
+'''
+import math, random
+import critters, strategies, world
+import environment as env
+
+#counts below this are dropped from expected histograms
+NEGLIGIBLE = 1e-9
+
+#below this many trials binomial draws are made one trial at a time
+EXACT_BINOMIAL_TRIALS = 64
+
+
+def cooperation_chance(strategy):
+    '''
+    returns the chance that the strategy cooperates with a partner it meets
+    in a large, well mixed population. Stateless strategies have their
+    kernel. Reactive strategies nearly always meet strangers there, so they
+    act as they would on a first meeting. In small populations partners
+    meet again and reactive strategies do better than this gives them
+    >>> cooperation_chance(strategies.RandomStrategy(3))
+    0.75
+    >>> cooperation_chance(strategies.GrudgerStrategy())
+    1.0
+    '''
+    if strategy.kernel is not None:
+        return strategy.kernel
+    if strategy.reactions is not None:
+        return float(strategy.reactions[0])
+    return 1.0
+
+
+def interactions_per_critter(size, number_of_interactions):
+    '''
+    returns the number of interactions a critter has in an iteration of
+    random pairing, on average: the partners it picks plus those that pick
+    it, less the pairs both members picked
+    >>> interactions_per_critter(1000, 5)
+    10
+    >>> interactions_per_critter(3, 5)
+    2
+    '''
+    partners = min(number_of_interactions, size - 1)
+    if partners <= 0:
+        return 0
+    both = float(partners) / (size - 1)
+    return int(round(partners * (2 - both)))
+
+
+def convolve(distribution1, distribution2):
+    '''
+    returns the distribution of the sum of two independent values, each
+    distribution being a dict of value to probability
+    >>> sorted(convolve({0: 0.5, 1: 0.5}, {0: 0.5, 1: 0.5}).items())
+    [(0, 0.25), (1, 0.5), (2, 0.25)]
+    '''
+    total = dict()
+    for value1, chance1 in distribution1.items():
+        for value2, chance2 in distribution2.items():
+            value = value1 + value2
+            total[value] = total.get(value, 0.0) + chance1 * chance2
+    return total
+
+
+def binomial(trials, chance, rng):
+    '''
+    returns a binomial draw. Large numbers of trials use the normal
+    approximation, so that a draw never costs more than
+    EXACT_BINOMIAL_TRIALS random numbers
+    >>> binomial(10, 0.0, random), binomial(10, 1.0, random)
+    (0, 10)
+    >>> 4000 < binomial(10000, 0.5, random.Random(1)) < 6000
+    True
+    '''
+    if chance <= 0.0 or trials <= 0:
+        return 0
+    if chance >= 1.0:
+        return trials
+    if trials <= EXACT_BINOMIAL_TRIALS:
+        draw = rng.random
+        return len([trial for trial in xrange(trials) if draw() < chance])
+    mean = trials * chance
+    deviation = math.sqrt(mean * (1.0 - chance))
+    return max(0, min(trials, int(round(rng.gauss(mean, deviation)))))
+
+
+class Cohort(object):
+    '''
+    All the critters of one strategy, kept as a histogram of how many
+    critters hold each amount of food
+    >>> cohort = Cohort(strategies.CheatStrategy(), {5: 10, 8: 2})
+    >>> cohort.name, cohort.count(), cohort.food()
+    ('CHT', 12, 66)
+    '''
+
+    def __init__(self, strategy, histogram=None):
+        self.strategy = strategy
+        self.name = strategy.short_name
+        self.histogram = histogram or dict()
+        self.births = 0
+        self.deaths = 0
+
+    def count(self):
+        '''returns the number of critters in the cohort'''
+        return sum(self.histogram.values())
+
+    def food(self):
+        '''returns the food held by the cohort'''
+        return sum([food * count for food, count in self.histogram.items()])
+
+
+class MeanFieldWorld(object):
+    '''
+    Simulates strategy cohorts rather than individual critters, with the
+    payoffs, food consumption and reproduction rules of the per-critter
+    world, taken from a world config. A config's capacity is not modelled.
+    Each iteration every critter meets partners drawn in proportion
+    to the strategies' shares, so the food a cohort's critters gain is
+    distributed the same way for all of them, whatever their number; the
+    cost of an iteration depends on the number of distinct food amounts,
+    not on the population.
+
+    In the expected mode every food histogram bin is spread over the gains
+    in proportion to their chances, giving fractional counts. In the
+    sampled mode each bin is split by multinomial draws, giving whole
+    critters and the noise of a finite population
+    >>> for mode in ('expected', 'sampled'):
+    ...     meanfield = MeanFieldWorld(mode, seed=1)
+    ...     meanfield.add_cohort(strategies.CheatStrategy(), 100, 500)
+    ...     meanfield.add_cohort(strategies.SuckerStrategy(), 100, 500)
+    ...     counts = meanfield.run(20)[-1][1]
+    ...     print mode, int(round(counts['CHT'])), int(round(counts['SCK']))
+    expected 166 100
+    sampled 164 100
+    >>> config = world.WorldConfig(cooperate_food=0, 
+    ...                            iteration_food_consumption=1)
+    >>> meanfield = MeanFieldWorld('sampled', config=config)
+    >>> meanfield.add_cohort(strategies.SuckerStrategy(), 10, 3)
+    >>> [counts['SCK'] for (iteration_no, counts, food) in meanfield.run(3)]
+    [10, 10, 0]
+    '''
+
+    def __init__(self, mode='expected', seed=None, config=None):
+        self.mode = mode
+        self.random = random.Random(seed)
+        self.config = config or world.WorldConfig()
+        self.payoffs = self.config.payoff_matrix()
+        self.cohorts = list()
+        self.iteration_no = 0
+
+    def add_cohort(self, strategy, count, food=critters.Critter.STARTING_FOOD):
+        '''adds a cohort of count critters with the given food each'''
+        self.cohorts.append(Cohort(strategy, {food: count}))
+
+    def add_environment(self, environment):
+        '''
+        adds cohorts holding the critters of a per-critter environment
+        >>> e = env.Environment()
+        >>> e.add_critters([critters.Critter(None, strategies.CheatStrategy())
+        ...                 for i in range(3)])
+        >>> meanfield = MeanFieldWorld()
+        >>> meanfield.add_environment(e)
+        >>> [(cohort.name, cohort.histogram) for cohort in meanfield.cohorts]
+        [('CHT', {5: 3})]
+        '''
+        cohorts = dict()
+        for critter in environment.ordered_critters():
+            name = critter.strategy.short_name
+            cohort = cohorts.get(name)
+            if cohort is None:
+                cohort = cohorts[name] = Cohort(critter.strategy.create_new())
+                self.cohorts.append(cohort)
+            histogram = cohort.histogram
+            histogram[critter.food] = histogram.get(critter.food, 0) + 1
+
+    def totals(self):
+        '''returns dicts of critter count and food total by strategy name'''
+        counts = dict([(cohort.name, cohort.count())
+                       for cohort in self.cohorts])
+        food = dict([(cohort.name, cohort.food()) for cohort in self.cohorts])
+        return counts, food
+
+    def run(self, iterations=15):
+        '''
+        runs until the given number of iterations and returns the history as
+        a list of (iteration_no, counts, food) tuples
+        '''
+        history = list()
+        while self.iteration_no < iterations:
+            self.run_iteration()
+            history.append((self.iteration_no,) + self.totals())
+        return history
+
+    def run_iteration(self):
+        '''advances every cohort by one iteration'''
+        self.iteration_no += 1
+        gains = self.gain_distributions()
+        for cohort, gain in zip(self.cohorts, gains):
+            if self.mode == 'expected':
+                histogram = self.spread(cohort.histogram, gain)
+            else:
+                histogram = self.sample(cohort.histogram, gain)
+            cohort.histogram = self.end_iteration(cohort, histogram)
+
+    def gain_distributions(self):
+        '''
+        returns, for every cohort, the distribution of the food one of its
+        critters gains in an iteration
+        '''
+        counts = [cohort.count() for cohort in self.cohorts]
+        size = sum(counts)
+        if size == 0:
+            return [{0: 1.0} for cohort in self.cohorts]
+
+        meetings = interactions_per_critter(
+            int(round(size)), self.config.number_of_interactions)
+        chances = [cooperation_chance(cohort.strategy)
+                   for cohort in self.cohorts]
+        payoffs = self.payoffs
+
+        distributions = list()
+        for own_chance in chances:
+            #the payoff of a single interaction with a random partner
+            single = dict()
+            for count, other_chance in zip(counts, chances):
+                share = float(count) / size
+                for own, own_p in ((0, 1 - own_chance), (1, own_chance)):
+                    for other, other_p in ((0, 1 - other_chance),
+                                           (1, other_chance)):
+                        chance = share * own_p * other_p
+                        if chance > 0:
+                            payoff = payoffs[own][other]
+                            single[payoff] = single.get(payoff, 0.0) + chance
+
+            total = {0: 1.0}
+            for meeting in xrange(meetings):
+                total = convolve(total, single)
+            distributions.append(total)
+        return distributions
+
+    def spread(self, histogram, gain):
+        '''returns the histogram with every bin spread over the gains'''
+        spread = dict()
+        for food, count in histogram.items():
+            for amount, chance in gain.items():
+                new_food = food + amount
+                spread[new_food] = spread.get(new_food, 0.0) + count * chance
+        return dict([(food, count) for food, count in spread.items()
+                     if count > NEGLIGIBLE])
+
+    def sample(self, histogram, gain):
+        '''returns the histogram with every bin split by multinomial draws'''
+        rng = self.random
+        amounts = sorted(gain.items())
+        sampled = dict()
+        for food, count in histogram.items():
+            remaining = count
+            mass = 1.0
+            for amount, chance in amounts:
+                if remaining <= 0:
+                    break
+                drawn = binomial(remaining, min(chance / mass, 1.0), rng)
+                if drawn:
+                    new_food = food + amount
+                    sampled[new_food] = sampled.get(new_food, 0) + drawn
+                remaining -= drawn
+                mass -= chance
+        return sampled
+
+    def end_iteration(self, cohort, histogram):
+        '''
+        applies reproduction, food consumption and starvation as the
+        environment does, and returns the resulting histogram
+        '''
+        required = self.config.food_required_to_reproduce
+        consumption = self.config.iteration_food_consumption
+
+        births = 0
+        after_births = dict()
+        for food, count in histogram.items():
+            if food > required:
+                births += count
+                food -= required
+            after_births[food] = after_births.get(food, 0) + count
+        if births:
+            starting = critters.Critter.STARTING_FOOD
+            after_births[starting] = after_births.get(starting, 0) + births
+
+        deaths = 0
+        remaining = dict()
+        for food, count in after_births.items():
+            food -= consumption
+            if food <= 0:
+                deaths += count
+            else:
+                remaining[food] = count
+
+        cohort.births += births
+        cohort.deaths += deaths
+        return remaining
+
+
+def compare_with_world(build, iterations, seeds, mode='expected', 
+                       config=None):
+    '''
+    runs the per-critter world from the environments build(world) returns
+    for each seed, and the mean field world from the first of them, both 
+    with the given config. Returns the final strategy counts of both, the 
+    world's averaged over the seeds
+    >>> def build(xworld):
+    ...     e = env.Environment()
+    ...     for strategy in (strategies.CheatStrategy,
+    ...                      strategies.SuckerStrategy) * 100:
+    ...         critter = critters.Critter(None, strategy())
+    ...         critter.food = 200
+    ...         e.add_critter(critter)
+    ...     return e
+    >>> per_critter, mean_field = compare_with_world(build, 60, range(3))
+    >>> [int(round(per_critter[name])) for name in ('CHT', 'SCK')]
+    [182, 100]
+    >>> [int(round(mean_field[name])) for name in ('CHT', 'SCK')]
+    [186, 100]
+    '''
+    totals = dict()
+    meanfield = None
+    for seed in seeds:
+        xworld = world.PrisonersDilemmaWorld(seed=seed, batched=True, 
+                                             config=config)
+        xworld.verbose = False
+        environment = build(xworld)
+        if meanfield is None:
+            meanfield = MeanFieldWorld(mode, seed, config)
+            meanfield.add_environment(environment)
+        xworld.run(iterations, environment)
+        for name, count in environment.strategy_counts.items():
+            totals[name] = totals.get(name, 0) + count
+
+    per_critter = dict([(name, float(count) / len(seeds))
+                        for name, count in totals.items()])
+    mean_field = meanfield.run(iterations)[-1][1]
+    return per_critter, mean_field
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
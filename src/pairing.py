@@ -0,0 +1,192 @@
+'''
+Created on Jun 2, 2011
+
+@author: bendavies
+'''
+import random
+import topology
+
+#constants
+NUMBER_OF_INTERACTIONS = 5
+
+
+class PairingEngine(object):
+    '''
+    An archetype for pairing engines. A pairing engine decides which critters
+    in a population will interact with each other during an iteration. 
+    Engines that pair critters by where they live keep a topology, which
+    the environment places its critters in
+    '''
+    
+    topology = None
+    
+    def create_topology(self, rng=random):
+        '''
+        returns a new topology for an environment to place its critters in,
+        or None if the engine does not need one
+        '''
+        return None
+
+    def determine_interactions(self, critters, rng=random):
+        '''
+        returns a list of (critter1, critter2) tuples, each pair appearing at
+        most once. Any random choices are drawn from rng
+        >>> PairingEngine().determine_interactions([])
+        []
+        '''
+        return list()
+
+
+class RandomPairing(PairingEngine):
+    '''
+    Fully random mixing. Every critter picks up to number_of_interactions
+    distinct partners from the rest of the population. A pair picked by both
+    of its members only interacts once.
+
+    Partners are sampled by index so the population is never copied, and
+    already-formed pairs are remembered in a set, so an iteration costs
+    O(n * number_of_interactions)
+    '''
+
+    def __init__(self, number_of_interactions=NUMBER_OF_INTERACTIONS):
+        self.number_of_interactions = number_of_interactions
+
+    def determine_interactions(self, critters, rng=random):
+        '''
+        determines which interactions will happen within the population
+        >>> from critters import Critter
+        >>> population = [Critter('c%d' % i, None) for i in range(20)]
+        >>> interactions = RandomPairing().determine_interactions(population)
+        >>> len(interactions) >= 50
+        True
+        >>> len(set(interactions)) == len(interactions)
+        True
+        >>> [c1 for (c1, c2) in interactions if c1.id >= c2.id]
+        []
+        >>> RandomPairing().determine_interactions(population[:1])
+        []
+        >>> len(RandomPairing().determine_interactions(population[:3]))
+        3
+        >>> pairs = [RandomPairing().determine_interactions(population,
+        ...                                                 random.Random(5))
+        ...          for i in range(2)]
+        >>> pairs[0] == pairs[1]
+        True
+        '''
+        critters = list(critters)
+        size = len(critters)
+        partners = min(self.number_of_interactions, size - 1)
+
+        interactions = list()
+        if partners <= 0:
+            return interactions
+
+        sample = rng.sample
+        others = xrange(size - 1)
+        paired = set()
+
+        for index in xrange(size):
+            critter = critters[index]
+
+            #sample among the other critters, skipping over this one
+            for other_index in sample(others, partners):
+                if other_index >= index:
+                    other_index += 1
+
+                if index < other_index:
+                    key = index * size + other_index
+                else:
+                    key = other_index * size + index
+
+                if key not in paired:
+                    paired.add(key)
+                    other_critter = critters[other_index]
+                    if critter.id < other_critter.id:
+                        interactions.append((critter, other_critter))
+                    else:
+                        interactions.append((other_critter, critter))
+
+        return interactions
+
+
+
+class LatticePairing(PairingEngine):
+    '''
+    Local mixing on a lattice. Every critter interacts with each critter in
+    a neighbouring cell once per iteration. Pairs are found by walking each
+    occupied cell's precomputed neighbour list, keeping only neighbours in
+    higher cells so that each pair is found once, so an iteration costs 
+    O(n * degree) whatever the size of the lattice
+    '''
+    
+    def __init__(self, width, height, radius=1):
+        self.width = width
+        self.height = height
+        self.radius = radius
+        
+    def create_topology(self, rng=random):
+        '''
+        returns a new lattice and pairs within it from now on
+        >>> engine = LatticePairing(10, 10)
+        >>> engine.create_topology() is engine.topology
+        True
+        '''
+        self.topology = topology.Lattice(self.width, self.height, self.radius,
+                                         rng)
+        return self.topology
+    
+    def determine_interactions(self, critters, rng=random):
+        '''
+        determines which interactions will happen between neighbours
+        >>> from critters import Critter
+        >>> engine = LatticePairing(3, 1)
+        >>> lattice = engine.create_topology(random.Random(1))
+        >>> population = [Critter('c%d' % i, None) for i in range(3)]
+        >>> [lattice.place(critter) for critter in population[:2]]
+        [True, True]
+        >>> len(engine.determine_interactions(population[:2]))
+        1
+        >>> engine = LatticePairing(20, 20)
+        >>> lattice = engine.create_topology(random.Random(2))
+        >>> population = [Critter(None, None) for i in range(400)]
+        >>> [lattice.place(critter) for critter in population].count(True)
+        400
+        >>> interactions = engine.determine_interactions(population)
+        >>> len(interactions), len(set(interactions))
+        (1600, 1600)
+        >>> engine.determine_interactions([Critter('stray', None)])
+        Traceback (most recent call last):
+        ...
+        ValueError: critter stray is not on the lattice
+        '''
+        lattice = self.topology
+        neighbours = lattice.neighbours
+        degree = lattice.degree
+        occupant = lattice.occupant
+        cell_of = lattice.cell_of
+        
+        interactions = list()
+        append = interactions.append
+        for critter in critters:
+            try:
+                cell = cell_of[critter.id]
+            except KeyError:
+                raise ValueError('critter %s is not on the lattice' % 
+                                 critter.name)
+            start = cell * degree
+            for other_cell in neighbours[start:start + degree]:
+                if other_cell <= cell:
+                    continue
+                other_critter = occupant[other_cell]
+                if other_critter is None:
+                    continue
+                if critter.id < other_critter.id:
+                    append((critter, other_critter))
+                else:
+                    append((other_critter, critter))
+        return interactions
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
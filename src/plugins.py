@@ -3,11 +3,43 @@ Created on May 24, 2011
 
 @author: bendavies
 '''
+import sys, csv, json, struct, zlib
+from array import array
+from itertools import izip
 import strategies, critters
+
+#the hooks a plugin can implement
+HOOKS = ('on_environment_start', 'on_iteration_start', 'on_iteration_end',
+         'on_environment_end', 'on_interaction_end', 'on_interactions_end')
+
+#the hooks called during iterations, which a plugin may only want for some
+ITERATION_HOOKS = ('on_iteration_start', 'on_iteration_end', 
+                   'on_interaction_end', 'on_interactions_end')
+
+
+def calculate_strategy_totals(environment):
+    '''
+    returns dicts of living critter count and food total by strategy name
+    >>> import environment as env
+    >>> e = env.Environment()
+    >>> e.add_critters((critters.Critter('c1', strategies.CheatStrategy()),
+    ...                 critters.Critter('c2', strategies.CheatStrategy())))
+    >>> calculate_strategy_totals(e)
+    ({'CHT': 2}, {'CHT': 10})
+    '''
+    return environment.strategy_totals()
     
     
 class EventPlugin(object):
     '''An archetype for plugin types'''
+    
+    def observes(self, iteration_no):
+        '''
+        returns whether the plugin wants the iteration hooks of an iteration.
+        Plugins that only sample some iterations say so here, and the world
+        runs iterations nobody observes without calling any plugin
+        '''
+        return True
 
     def on_environment_start(self, environment):
         '''called prior to the start of iterations with the initial environment'''
@@ -30,20 +62,87 @@ class EventPlugin(object):
         '''called at the end of an interaction between two agents'''
         pass
     
+    def on_interactions_end(self, environment, batch):
+        '''called once all of an iteration's interactions have ended, with an
+        InteractionBatch holding them'''
+        pass
+    
+
+def implemented_hooks(plugin):
+    '''
+    returns the names of the hooks a plugin implements itself rather than 
+    inheriting from EventPlugin
+    >>> implemented_hooks(EventPlugin())
+    []
+    >>> implemented_hooks(CritterTracker('c1'))
+    ['on_iteration_start', 'on_environment_end', 'on_interactions_end']
+    '''
+    hooks = list()
+    for hook in HOOKS:
+        method = getattr(plugin, hook, None)
+        if method is None:
+            continue
+        if getattr(method, 'im_func', None) is not getattr(EventPlugin, hook).im_func:
+            hooks.append(hook)
+    return hooks
+    
+    
+def check_interval(interval):
+    '''returns a reporting interval, raising ValueError if it is below 1'''
+    if interval < 1:
+        raise ValueError('report interval must be at least 1, not %d' % 
+                         interval)
+    return interval
+
+
 class IndividualTabularReporter(EventPlugin):
-    '''Provides basic text output to the standard out'''
+    '''
+    Provides basic text output to the standard out for the first iteration
+    and then every interval iterations
+    >>> import world, environment, critters, strategies
+    >>> xworld = world.PrisonersDilemmaWorld(seed=1)
+    >>> xworld.verbose = False
+    >>> xworld.add_plugin(IndividualTabularReporter(3))
+    >>> e = environment.Environment()
+    >>> e.add_critters([critters.Critter(name, strategies.SuckerStrategy())
+    ...                 for name in ('s1', 's2')])
+    >>> xworld.run(7, e) # doctest:+NORMALIZE_WHITESPACE
+    p: s1 s2
+    1: 9 9
+    3: 11 11
+    6: 14 14
+    Final Food Totals
+    7: 12 12
+    p: s1 s2
+    winners are s1 s2
+    '''
+    
+    def __init__(self, interval=5):
+        '''
+        Constructor. interval must be at least 1
+        >>> IndividualTabularReporter(0)
+        Traceback (most recent call last):
+        ...
+        ValueError: report interval must be at least 1, not 0
+        '''
+        self.interval = check_interval(interval)
+        
+    def observes(self, iteration_no):
+        '''
+        the reporter only observes the iterations it reports
+        >>> reporter = IndividualTabularReporter()
+        >>> [i for i in range(1, 12) if reporter.observes(i)]
+        [1, 5, 10]
+        '''
+        return iteration_no == 1 or iteration_no % self.interval == 0
 
     def on_environment_start(self, environment):
         '''called prior to the start of iterations with the initial environment'''
         self.print_headers(environment)
     
-    def on_iteration_start(self, environment):
-        '''called at the start of the iteration'''
-        pass
-    
     def on_iteration_end(self, environment):
         '''called at the end of the iteration'''
-        if environment.iteration_no == 1 or environment.iteration_no % 5 == 0:
+        if self.observes(environment.iteration_no):
             self.print_iteration_line(environment)
     
     def on_environment_end(self, environment):
@@ -53,7 +152,7 @@ class IndividualTabularReporter(EventPlugin):
         self.print_iteration_line(environment)
         self.print_headers(environment)
         
-        population = environment.population
+        population = environment.ordered_critters()
         max_food = max([critter.food for critter in population])
         winners = [critter.name + ' ' for critter in population 
                    if (critter.food == max_food)]
@@ -62,31 +161,49 @@ class IndividualTabularReporter(EventPlugin):
     def print_headers(self, environment):
         '''Write the headers'''
         header_line = 'p:\t'
-        for critter in environment.population:
+        for critter in environment.ordered_critters():
             header_line += '%s\t' % critter.name
         print header_line
         
     def print_iteration_line(self, environment):
         '''Write a reporting line for the iteration with current food values'''        
         report_line = ('%d:\t' % environment.iteration_no)
-        for critter in environment.population:
+        for critter in environment.ordered_critters():
             report_line += '%d\t' % critter.food
         print report_line
 
 class StrategyTabularReporter(EventPlugin):
-    '''Provides basic output summarising strategy level numbers to the std out'''
+    '''
+    Provides basic output summarising strategy level numbers to the std out
+    for the first iteration and then every interval iterations
+    '''
+    
+    def __init__(self, interval=5):
+        '''
+        Constructor. interval must be at least 1
+        >>> StrategyTabularReporter(-1)
+        Traceback (most recent call last):
+        ...
+        ValueError: report interval must be at least 1, not -1
+        '''
+        self.interval = check_interval(interval)
+        
+    def observes(self, iteration_no):
+        '''
+        the reporter only observes the iterations it reports
+        >>> reporter = StrategyTabularReporter()
+        >>> [i for i in range(1, 12) if reporter.observes(i)]
+        [1, 5, 10]
+        '''
+        return iteration_no == 1 or iteration_no % self.interval == 0
 
     def on_environment_start(self, environment):
         '''called prior to the start of iterations with the initial environment'''
         self.print_headers(environment)
     
-    def on_iteration_start(self, environment):
-        '''called at the start of the iteration'''
-        pass
-    
     def on_iteration_end(self, environment):
         '''called at the end of the iteration'''
-        if environment.iteration_no == 1 or environment.iteration_no % 5 == 0:
+        if self.observes(environment.iteration_no):
             self.print_iteration_line(environment)
     
     def on_environment_end(self, environment):
@@ -131,17 +248,196 @@ class StrategyTabularReporter(EventPlugin):
         print report_line
         
     def calculate_strategy_totals(self, environment):
-        food_count = dict()
-        for strategy in environment.strategy_counts.keys():
-            food_count[strategy] = 0
+        return calculate_strategy_totals(environment)
+        
+class StrategyHistoryRecorder(EventPlugin):
+    '''Records the living critter count and food total of every strategy at
+    the end of each iteration'''
+    
+    def __init__(self):
+        self.history = list()
+        super(StrategyHistoryRecorder, self).__init__()
+    
+    def on_iteration_end(self, environment):
+        '''called at the end of the iteration'''
+        critter_count, food_count = calculate_strategy_totals(environment)
+        self.history.append((environment.iteration_no, critter_count, 
+                             food_count))
+        
+class MetricsSink(EventPlugin):
+    '''
+    Streams per-iteration metrics to a file: the living count and food total
+    of every strategy, births, deaths and the outcomes of the iteration's
+    interactions. Rows are buffered and written in chunks of chunk_size so 
+    memory stays flat however long the run.
+    
+    The default format is columnar binary: a text line naming the format, a
+    JSON header line, then chunks of a row count and a byte count followed by
+    the zlib compressed columns, each a packed array. With fmt='csv' plain
+    CSV rows are written instead.
+    
+    A row for an iteration is written once it is over, ie after the critters
+    have consumed their food
+    '''
+    
+    MAGIC = 'GENERATIONS-METRICS 1\n'
+    TYPECODE = 'l'
+    
+    def __init__(self, path, fmt='binary', chunk_size=1000):
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.columns = None
+        self.strategies = None
+        self.buffer = None
+        self.output = None
+        self.writer = None
+        self.births = 0
+        self.deaths = 0
+        #interaction counts, indexed by first action * 2 + second action
+        self.outcomes = [0, 0, 0, 0]
+        super(MetricsSink, self).__init__()
+        
+    def on_environment_start(self, environment):
+        '''opens the file and writes its header'''
+        self.strategies = sorted(calculate_strategy_totals(environment)[0].keys())
+        self.columns = ['iteration']
+        for strategy in self.strategies:
+            self.columns.extend(['%s_count' % strategy, '%s_food' % strategy])
+        self.columns.extend(['births', 'deaths', 'cooperations', 
+                             'exploitations', 'defections'])
+        self.births = environment.births
+        self.deaths = environment.deaths
+        
+        self.output = open(self.path, 'wb')
+        if self.fmt == 'csv':
+            self.writer = csv.writer(self.output)
+            self.writer.writerow(self.columns)
+        else:
+            self.output.write(MetricsSink.MAGIC)
+            self.output.write(json.dumps({
+                    'columns': self.columns,
+                    'typecode': MetricsSink.TYPECODE,
+                    'itemsize': array(MetricsSink.TYPECODE).itemsize,
+                    'byteorder': sys.byteorder}) + '\n')
             
-        for critter in environment.population.values():
-            food_count[critter.strategy.short_name] += critter.food
-
+        self.buffer = [array(MetricsSink.TYPECODE) for column in self.columns]
+        
+    def on_iteration_start(self, environment):
+        '''records the iteration that has just finished'''
+        if environment.iteration_no > 1:
+            self.record(environment, environment.iteration_no - 1)
+    
+    def on_interactions_end(self, environment, batch):
+        '''tallies the outcomes of the iteration's interactions'''
+        outcomes = self.outcomes
+        for action1, action2 in izip(batch.agent1_outcome, batch.agent2_outcome):
+            outcomes[action1 * 2 + action2] += 1
+            
+    def on_environment_end(self, environment):
+        '''records the final iteration and closes the file'''
+        if environment.iteration_no > 0:
+            self.record(environment, environment.iteration_no)
+        self.flush()
+        self.output.close()
+        
+    def record(self, environment, iteration_no):
+        '''buffers a row for the iteration, writing a chunk if the buffer is full'''
+        critter_count, food_count = calculate_strategy_totals(environment)
+        outcomes = self.outcomes
+        
+        row = [iteration_no]
+        for strategy in self.strategies:
+            row.append(critter_count.get(strategy, 0))
+            row.append(food_count.get(strategy, 0))
+        row.extend([environment.births - self.births, 
+                    environment.deaths - self.deaths,
+                    outcomes[3], outcomes[1] + outcomes[2], outcomes[0]])
+        
+        for column, value in izip(self.buffer, row):
+            column.append(value)
+        
+        self.births = environment.births
+        self.deaths = environment.deaths
+        self.outcomes = [0, 0, 0, 0]
+        
+        if len(self.buffer[0]) >= self.chunk_size:
+            self.flush()
+            
+    def flush(self):
+        '''writes the buffered rows to the file'''
+        rows = len(self.buffer[0])
+        if not rows:
+            return
+        
+        if self.fmt == 'csv':
+            self.writer.writerows(izip(*self.buffer))
+        else:
+            data = zlib.compress(''.join([column.tostring() 
+                                          for column in self.buffer]))
+            self.output.write(struct.pack('<II', rows, len(data)))
+            self.output.write(data)
+        
+        self.output.flush()
+        self.buffer = [array(MetricsSink.TYPECODE) for column in self.columns]
+        
 
+def read_metrics(path):
+    '''
+    reads a file written by a MetricsSink, in either format, and returns a
+    dict of column name to list of values
+    >>> import os, tempfile, world
+    >>> path = tempfile.mktemp()
+    >>> xworld = world.PrisonersDilemmaWorld(seed=1)
+    >>> xworld.verbose = False
+    >>> xworld.add_plugin(MetricsSink(path, chunk_size=2))
+    >>> xworld.run(5)
+    >>> metrics = read_metrics(path)
+    >>> metrics['iteration']
+    [1, 2, 3, 4, 5]
+    >>> metrics['CHT_count']
+    [1, 1, 1, 1, 1]
+    >>> xworld = world.PrisonersDilemmaWorld(seed=1)
+    >>> xworld.verbose = False
+    >>> xworld.add_plugin(MetricsSink(path, 'csv'))
+    >>> xworld.run(5)
+    >>> read_metrics(path) == metrics
+    True
+    >>> os.remove(path)
+    '''
+    source = open(path, 'rb')
+    try:
+        if source.readline() != MetricsSink.MAGIC:
+            source.seek(0)
+            reader = csv.reader(source)
+            columns = reader.next()
+            values = [list() for column in columns]
+            for row in reader:
+                for column, value in izip(values, row):
+                    column.append(int(value))
+            return dict(izip(columns, values))
+        
+        header = json.loads(source.readline())
+        columns = [str(column) for column in header['columns']]
+        values = [array(str(header['typecode'])) for column in columns]
+        swap = header['byteorder'] != sys.byteorder
         
-        return environment.strategy_counts, food_count
+        while True:
+            prefix = source.read(8)
+            if not prefix:
+                break
+            rows, size = struct.unpack('<II', prefix)
+            chunk = array(values[0].typecode, zlib.decompress(source.read(size)))
+            if swap:
+                chunk.byteswap()
+            for column_no, column in enumerate(values):
+                column.extend(chunk[column_no * rows:(column_no + 1) * rows])
         
+        return dict(izip(columns, [column.tolist() for column in values]))
+    finally:
+        source.close()
+    
+
 class CritterTracker(EventPlugin):
     '''Keeps track of an individual critter and summarises their interaction at
     the conclusion of the environment'''
@@ -153,6 +449,7 @@ class CritterTracker(EventPlugin):
 
     def __init__(self, critter_name):
         self.critter_name = critter_name
+        self.critter_id = None
         self.log_items = list()
         self.attached = False
         self.iteration_no = 0
@@ -208,35 +505,45 @@ class CritterTracker(EventPlugin):
     def on_iteration_start(self, environment):
         self.iteration_no = environment.iteration_no
         
-        if not self.attached and environment.population.has_key(self.critter_name):
-            self.attach_to_critter(environment.population[self.critter_name])
+        if not self.attached:
+            critter = environment.find_critter(self.critter_name)
+            if critter is not None:
+                self.attach_to_critter(critter)
              
     
     
-    def on_interaction_end(self, environment, agent1, agent1_outcome, agent2, agent2_outcome):
-        '''called at the end of an interaction between two agents'''
+    def on_interactions_end(self, environment, batch):
+        '''
+        called once the iteration's interactions have ended. The food logged
+        is the tracked critter's food after all of them
+        '''
+        
+        critter_id = self.critter_id
+        if critter_id is None:
+            return
         
-        log_item = None
-        
-        if agent1.name == self.critter_name:
-            log_item = (CritterTracker.LOG_ITEM_INTERACTION,
-                        environment.iteration_no, 
-                        agent1.name,
-                        agent1_outcome,
-                        agent2.name,
-                        agent2_outcome,
-                        agent1.food)               
-        elif agent2.name == self.critter_name:
-            log_item = (CritterTracker.LOG_ITEM_INTERACTION,
-                        environment.iteration_no,
-                        agent2.name,
-                        agent2_outcome,
-                        agent1.name,
-                        agent1_outcome,
-                        agent2.food)               
-        
-        if log_item:    
-            self.log_items.append(log_item)
+        for agent1, agent1_outcome, agent2, agent2_outcome in batch:
+            log_item = None
+            
+            if agent1.id == critter_id:
+                log_item = (CritterTracker.LOG_ITEM_INTERACTION,
+                            environment.iteration_no, 
+                            agent1.name,
+                            agent1_outcome,
+                            agent2.name,
+                            agent2_outcome,
+                            agent1.food)               
+            elif agent2.id == critter_id:
+                log_item = (CritterTracker.LOG_ITEM_INTERACTION,
+                            environment.iteration_no,
+                            agent2.name,
+                            agent2_outcome,
+                            agent1.name,
+                            agent1_outcome,
+                            agent2.food)               
+            
+            if log_item:    
+                self.log_items.append(log_item)
         
 
     def receive_event(self, source, event, data):
@@ -255,6 +562,7 @@ class CritterTracker(EventPlugin):
         critter.add_listener(self, critters.Critter.EVENT_DYING)
         critter.add_listener(self, critters.Critter.EVENT_REPRODUCING)
         
+        self.critter_id = critter.id
         self.attached = True
     
 if __name__ == '__main__':
@@ -0,0 +1,123 @@
+'''
+Created on Jun 6, 2011
+
+@author: bendavies
+'''
+from array import array
+from itertools import izip
+
+
+class PopulationStore(object):
+    '''
+    Keeps the numeric state of a population in contiguous arrays rather than
+    in the critters themselves. Each critter occupies an index; the arrays
+    hold its food, offspring count, strategy id and whether it is alive,
+    and critter ids map to indexes and back. Indexes of dead critters are
+    reused by later additions
+    >>> store = PopulationStore()
+    >>> store.add(11, 'CHT', 5)
+    0
+    >>> store.add(12, 'SCK', 5)
+    1
+    >>> store.food[store.index_of[12]] += 3
+    >>> counts, food = store.strategy_totals()
+    >>> sorted(food.items())
+    [('CHT', 5), ('SCK', 8)]
+    >>> store.remove(11)
+    >>> len(store)
+    1
+    >>> store.add(13, 'CHT', 5)
+    0
+    >>> store.ids[0]
+    13
+    '''
+
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.food = array('l')
+        self.offspring = array('l')
+        self.strategy_id = array('H')
+        self.alive = array('b')
+        self.ids = array('l')
+
+        self.index_of = dict()
+        self.strategy_names = list()
+        self.strategy_ids = dict()
+        self.free_indexes = list()
+
+    def __len__(self):
+        return len(self.index_of)
+
+    def get_strategy_id(self, strategy_name):
+        '''
+        returns the id for a strategy short name, allocating one if needed
+        >>> store = PopulationStore()
+        >>> store.get_strategy_id('CHT'), store.get_strategy_id('SCK')
+        (0, 1)
+        >>> store.get_strategy_id('CHT')
+        0
+        '''
+        strategy_id = self.strategy_ids.get(strategy_name)
+        if strategy_id is None:
+            strategy_id = len(self.strategy_names)
+            self.strategy_ids[strategy_name] = strategy_id
+            self.strategy_names.append(strategy_name)
+        return strategy_id
+
+    def add(self, critter_id, strategy_name, food=0, offspring=0):
+        '''
+        stores a critter and returns its index
+        '''
+        strategy_id = self.get_strategy_id(strategy_name)
+
+        if self.free_indexes:
+            index = self.free_indexes.pop()
+            self.food[index] = food
+            self.offspring[index] = offspring
+            self.strategy_id[index] = strategy_id
+            self.alive[index] = 1
+            self.ids[index] = critter_id
+        else:
+            index = len(self.ids)
+            self.food.append(food)
+            self.offspring.append(offspring)
+            self.strategy_id.append(strategy_id)
+            self.alive.append(1)
+            self.ids.append(critter_id)
+
+        self.index_of[critter_id] = index
+        return index
+
+    def remove(self, critter_id):
+        '''
+        marks the critter as dead and frees its index
+        '''
+        index = self.index_of.pop(critter_id)
+        self.alive[index] = 0
+        self.ids[index] = 0
+        self.free_indexes.append(index)
+
+    def strategy_totals(self):
+        '''
+        returns dicts of living critter count and food total by strategy name,
+        in a single pass over the arrays
+        '''
+        number_of_strategies = len(self.strategy_names)
+        counts = [0] * number_of_strategies
+        food = [0] * number_of_strategies
+
+        for strategy_id, critter_food, alive in izip(self.strategy_id,
+                                                      self.food, self.alive):
+            if alive:
+                counts[strategy_id] += 1
+                food[strategy_id] += critter_food
+
+        return (dict(izip(self.strategy_names, counts)),
+                dict(izip(self.strategy_names, food)))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,127 @@
+'''
+Created on Jun 23, 2011
+
+@author: bendavies
+'''
+import gc, time
+
+
+def container_count():
+    '''
+    returns a running count of the containers tracked by the garbage 
+    collector, built from the collector's generation counters. Only the 
+    differences between two counts mean anything: they are the net number 
+    of containers created in between, less those freed. This is not a count
+    of allocations: objects that are not containers are left out, containers
+    reused from a type's free list are not counted, and a full collection 
+    resets the count, so a difference spanning one is lost
+    >>> class Node(object):
+    ...     pass
+    >>> gc.disable()
+    >>> before = container_count()
+    >>> nodes = [Node() for i in range(1000)]
+    >>> 1000 <= container_count() - before < 1010
+    True
+    >>> del nodes
+    >>> container_count() - before < 10
+    True
+    >>> gc.enable()
+    '''
+    threshold0, threshold1, threshold2 = gc.get_threshold()
+    count0, count1, count2 = gc.get_count()
+    return count0 + threshold0 * (count1 + threshold1 * count2)
+
+
+class RunStats(object):
+    '''
+    Wall time, call count and net change in garbage collected containers 
+    (see container_count) of each phase of a running world. last_iteration
+    holds the figures of the most recently completed iteration and totals 
+    those of the whole run, both as dicts of phase name to [seconds, calls,
+    containers]
+    >>> stats = RunStats()
+    >>> stats.start('pairing')
+    >>> stats.stop()
+    >>> stats.end_iteration()
+    >>> stats.iterations, stats.last_iteration['pairing'][1]
+    (1, 1)
+    >>> stats.totals['pairing'][1]
+    1
+    '''
+
+    def __init__(self):
+        self.iterations = 0
+        self.totals = dict()
+        self.last_iteration = dict()
+        self.current = dict()
+        self.phase = None
+        self.started = 0.0
+        self.containers = 0
+
+    def start(self, phase):
+        '''starts timing a phase'''
+        self.phase = phase
+        self.containers = container_count()
+        self.started = time.time()
+
+    def stop(self):
+        '''stops timing the current phase and adds it to the iteration'''
+        elapsed = time.time() - self.started
+        containers = container_count() - self.containers
+        self.add(self.phase, elapsed, 1, max(containers, 0))
+        self.phase = None
+
+    def add(self, phase, seconds, calls=1, containers=0):
+        '''
+        adds figures measured elsewhere to a phase of the iteration, for 
+        phases that are interleaved too finely to start and stop
+        >>> stats = RunStats()
+        >>> stats.add('payoffs', 0.5)
+        >>> stats.add('payoffs', 0.25)
+        >>> stats.current['payoffs']
+        [0.75, 2, 0]
+        '''
+        record = self.current.get(phase)
+        if record is None:
+            record = self.current[phase] = [0.0, 0, 0]
+        record[0] += seconds
+        record[1] += calls
+        record[2] += containers
+
+    def end_iteration(self):
+        '''completes the iteration, adding its figures to the totals'''
+        for phase, (seconds, calls, containers) in self.current.items():
+            total = self.totals.get(phase)
+            if total is None:
+                total = self.totals[phase] = [0.0, 0, 0]
+            total[0] += seconds
+            total[1] += calls
+            total[2] += containers
+
+        self.last_iteration = self.current
+        self.current = dict()
+        self.iterations += 1
+
+    def report(self):
+        '''
+        returns a printable summary of the totals, slowest phase first
+        >>> stats = RunStats()
+        >>> stats.totals['pairing'] = [2.0, 4, 10]
+        >>> stats.iterations = 4
+        >>> print stats.report()
+        phase             seconds   per iter      calls containers
+        pairing             2.000    0.50000          4         10
+        '''
+        lines = ['%-14s %10s %10s %10s %10s' % ('phase', 'seconds', 'per iter',
+                                                'calls', 'containers')]
+        ranked = sorted(self.totals.items(), key=lambda item: -item[1][0])
+        for phase, (seconds, calls, containers) in ranked:
+            lines.append('%-14s %10.3f %10.5f %10d %10d' % (
+                phase, seconds, seconds / max(self.iterations, 1),
+                calls, containers))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,152 @@
+'''
+Created on Jun 9, 2011
+
+@author: bendavies
+'''
+import multiprocessing
+import world, plugins
+
+
+class RunSpec(object):
+    '''
+    Describes a single independent world run: its seed, how many iterations
+    to run for and keyword options for the PrisonersDilemmaWorld constructor
+    '''
+    
+    def __init__(self, seed, iterations=15, options=None):
+        self.seed = seed
+        self.iterations = iterations
+        self.options = options or dict()
+        
+    def __repr__(self):
+        return 'RunSpec(%r, %r, %r)' % (self.seed, self.iterations, 
+                                        self.options)
+
+
+class RunResult(object):
+    '''
+    The outcome of a run. history holds one (iteration_no, strategy counts,
+    strategy food totals) tuple per iteration. stop_reason says why the run
+    stopped early, or is None if it ran all its iterations
+    '''
+    
+    def __init__(self, spec, history, stop_reason=None):
+        self.spec = spec
+        self.history = history
+        self.stop_reason = stop_reason
+        
+    def final_counts(self):
+        '''returns the strategy counts after the last iteration'''
+        if not self.history:
+            return dict()
+        return self.history[-1][1]
+
+
+def make_specs(runs, iterations=15, base_seed=0, options=None):
+    '''
+    creates run specs for a number of runs, each with its own seed
+    >>> make_specs(2, 10, 7)
+    [RunSpec(7, 10, {}), RunSpec(8, 10, {})]
+    '''
+    return [RunSpec(base_seed + run_no, iterations, options) 
+            for run_no in range(runs)]
+    
+
+def run_world(spec):
+    '''
+    runs the world described by a run spec and returns its result. This is
+    the unit of work handed to pool processes
+    >>> result = run_world(RunSpec(1, 3))
+    >>> [iteration_no for (iteration_no, counts, food) in result.history]
+    [1, 2, 3]
+    >>> run_world(RunSpec(1, 3)).history == result.history
+    True
+    
+    a run does not depend on the objects created before it in the process
+    >>> import critters
+    >>> critters.EnvironmentObject.number_of = 0
+    >>> first = run_world(RunSpec(1, 200)).history
+    >>> critters.EnvironmentObject.number_of = 1000
+    >>> run_world(RunSpec(1, 200)).history == first
+    True
+    >>> import stopping
+    >>> result = run_world(RunSpec(1, 100, {
+    ...     'stopping_conditions': [stopping.StableShares(3)],
+    ...     'config': world.WorldConfig(food_required_to_reproduce=40)}))
+    >>> result.stop_reason, len(result.history)
+    ('stable', 41)
+    >>> result.history[-1][1] == result.history[0][1]
+    False
+    '''
+    xworld = world.PrisonersDilemmaWorld(seed=spec.seed, **spec.options)
+    xworld.verbose = False
+    recorder = plugins.StrategyHistoryRecorder()
+    xworld.add_plugin(recorder)
+    xworld.run(spec.iterations)
+    
+    return RunResult(spec, recorder.history, xworld.stop_reason)
+
+
+class BatchRunner(object):
+    '''
+    Spreads independent world runs over a pool of processes and gathers 
+    their results back in the parent
+    '''
+    
+    def __init__(self, processes=None):
+        '''
+        Constructor. processes defaults to the number of cpus; with a single
+        process the runs execute in this process
+        '''
+        self.processes = processes or multiprocessing.cpu_count()
+        
+    def run(self, specs):
+        '''
+        executes the runs and returns their results in the order of specs
+        >>> results = BatchRunner(2).run(make_specs(3, 2))
+        >>> [result.spec.seed for result in results]
+        [0, 1, 2]
+        >>> results[1].history == run_world(RunSpec(1, 2)).history
+        True
+        '''
+        if self.processes == 1 or len(specs) <= 1:
+            return [run_world(spec) for spec in specs]
+        
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.map(run_world, specs, 1)
+        finally:
+            pool.close()
+            pool.join()
+        
+        return results
+
+
+def merge_results(results):
+    '''
+    merges the histories of many runs into per-iteration totals of strategy
+    counts and food across all runs. Returns a list of (iteration_no, counts,
+    food) tuples
+    >>> merged = merge_results([run_world(RunSpec(seed, 2)) for seed in (1, 2)])
+    >>> [(iteration_no, counts['CHT']) for (iteration_no, counts, food) in merged]
+    [(1, 2), (2, 2)]
+    '''
+    totals = dict()
+    
+    for result in results:
+        for iteration_no, critter_count, food_count in result.history:
+            if iteration_no not in totals:
+                totals[iteration_no] = (dict(), dict())
+            count_total, food_total = totals[iteration_no]
+            for strategy, count in critter_count.items():
+                count_total[strategy] = count_total.get(strategy, 0) + count
+            for strategy, food in food_count.items():
+                food_total[strategy] = food_total.get(strategy, 0) + food
+                
+    return [(iteration_no, totals[iteration_no][0], totals[iteration_no][1])
+            for iteration_no in sorted(totals.keys())]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
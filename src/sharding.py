@@ -0,0 +1,316 @@
+'''
+Created on Jun 29, 2011
+
+@author: bendavies
+'''
+import multiprocessing
+import critters, world
+
+#constants
+MIGRATION_RATE = 0.01
+MIGRATION_INTERVAL = 1
+
+#columns of the shared statistics array
+ALIVE, FOOD, BIRTHS, DEATHS = range(4)
+COLUMNS = 4
+
+
+def create_environment(xworld):
+    '''creates the whole world's environment with the world's own critters'''
+    return xworld.create_environment()
+
+
+def shard_capacity(capacity, index, shards):
+    '''
+    returns a shard's part of the whole world's capacity. The parts add up 
+    to the capacity, the lowest-numbered shards taking what does not divide
+    >>> [shard_capacity(10, index, 4) for index in range(4)]
+    [3, 3, 2, 2]
+    >>> shard_capacity(None, 0, 4) is None
+    True
+    '''
+    if capacity is None:
+        return None
+    return capacity // shards + (index < capacity % shards)
+
+
+def split_population(environment, shards):
+    '''
+    takes every critter out of the environment and deals them out to the 
+    shards in id order. Returns the list of critters of each shard
+    >>> environment = world.PrisonersDilemmaWorld(seed=1).create_environment()
+    >>> parts = split_population(environment, 4)
+    >>> [len(part) for part in parts], len(environment.population)
+    ([2, 2, 1, 1], 0)
+    '''
+    population = environment.ordered_critters()
+    for critter in population:
+        environment.remove_critter(critter)
+    return [population[index::shards] for index in xrange(shards)]
+
+
+class Shard(object):
+    '''
+    One part of a sharded world: a world and an environment holding the
+    shard's part of the population, run in a worker process. After every 
+    iteration the shard writes its strategy totals into its row of the 
+    shared statistics array, and hands over a sample of its critters to move
+    to the next shard. With a shared pairwise memory the emigrants take 
+    their own entries with them, as they would in their strategies' own 
+    memories; the entries the shard's critters hold about them are dropped
+    >>> import strategies
+    >>> statistics = multiprocessing.Array('l', COLUMNS, lock=False)
+    >>> tit_for_tats = [critters.Critter(None, strategies.TitForTatStrategy())
+    ...                 for i in range(4)]
+    >>> shard = Shard(0, 1, 1, {'shared_memory': True}, tit_for_tats, 1000,
+    ...               ['T4T'], statistics, 1.0)
+    >>> emigrants, entries = shard.iterate((list(), list()), True)
+    >>> len(emigrants), len(entries) > 0, len(shard.environment.population)
+    (4, True, 0)
+    >>> other = Shard(0, 1, 2, {'shared_memory': True}, list(), 2000,
+    ...               ['T4T'], statistics, 0.0)
+    >>> other.admit(emigrants, entries)
+    >>> sorted(other.environment.memory.states.items()) == sorted(entries)
+    True
+    '''
+    
+    def __init__(self, index, shards, seed, options, population, first_id,
+                 strategy_names, statistics, migration_rate):
+        self.index = index
+        self.statistics = statistics
+        self.migration_rate = migration_rate
+        self.columns = dict([(name, column) 
+                             for column, name in enumerate(strategy_names)])
+        self.row = index * len(strategy_names) * COLUMNS
+        
+        #keep critter ids unique across the shards, and above the ids of
+        #the critters the world started with
+        critters.EnvironmentObject.number_of = first_id + index
+        critters.EnvironmentObject.id_step = shards
+        
+        #the world's capacity is shared out, so the shards together hold no
+        #more critters than the world would
+        config = options.get('config')
+        if config is not None and config.capacity is not None:
+            options = dict(options)
+            options['config'] = config.replace(
+                capacity=shard_capacity(config.capacity, index, shards))
+        
+        self.world = world.PrisonersDilemmaWorld(seed=seed, **options)
+        self.world.verbose = False
+        self.environment = self.world.create_empty_environment()
+        self.admit(population)
+    
+    def admit(self, population, entries=()):
+        '''
+        adds critters to the shard's environment, with the entries they hold
+        in a pairwise memory. Critters with a stochastic strategy draw from 
+        the shard's generator from now on
+        '''
+        xworld = self.world
+        environment = self.environment
+        for critter in population:
+            if getattr(critter.strategy, 'random', None) is not None:
+                critter.strategy.random = xworld.random
+            environment.add_critter(critter)
+        if environment.memory is not None and population:
+            environment.memory.restore(
+                set([critter.id for critter in population]), entries)
+        
+    def iterate(self, immigrants, migrate):
+        '''
+        admits the immigrants, given as a pair of critters and their pairwise
+        memory entries, runs one iteration and publishes the totals. Returns
+        the critters leaving the shard and their entries
+        '''
+        xworld = self.world
+        environment = self.environment
+        self.admit(*immigrants)
+        
+        environment.start_iteration()
+        xworld.run_iteration(environment)
+        environment.end_iteration()
+        
+        emigrants = list()
+        if migrate:
+            population = environment.ordered_critters()
+            count = int(len(population) * self.migration_rate)
+            emigrants = xworld.random.sample(population, count)
+            for critter in emigrants:
+                environment.remove_critter(critter)
+        
+        entries = list()
+        memory = environment.memory
+        if memory is not None:
+            remembering = set([critter.id for critter in emigrants
+                               if critter.strategy.remembers])
+            if remembering:
+                entries = memory.entries_of(remembering)
+        
+        self.publish()
+        return emigrants, entries
+    
+    def publish(self):
+        '''writes the shard's strategy totals to its row of the array'''
+        statistics = self.statistics
+        for name, totals in self.environment.strategy_stats.items():
+            column = self.row + self.columns[name] * COLUMNS
+            statistics[column + ALIVE] = totals.alive
+            statistics[column + FOOD] = totals.food
+            statistics[column + BIRTHS] = totals.births
+            statistics[column + DEATHS] = totals.deaths
+
+
+def run_shard(connection, *shard_args):
+    '''
+    serves iteration requests for one shard until told to stop. This is the
+    body of each worker process
+    '''
+    shard = Shard(*shard_args)
+    while True:
+        command, immigrants, migrate = connection.recv()
+        if command == 'stop':
+            break
+        connection.send(shard.iterate(immigrants, migrate))
+    connection.close()
+
+
+class ShardedWorld(object):
+    '''
+    Runs one large world as a number of shards in worker processes. The
+    world's population is created once, in this process, and dealt out to 
+    the shards, so the shards together hold the population of the unsharded
+    world. Critters are paired within their own shard; every migration 
+    interval each shard
+    sends a migration rate sample of its critters to the next shard in a 
+    ring, so that the shards stay mixed. The shards meet at a barrier after
+    every iteration, where their food, birth and death totals are merged
+    from a shared-memory array instead of being pickled. Only the totals
+    are shared: the critters, dealt out at the start and migrating after, 
+    are pickled through the shards' pipes.
+    
+    options are keyword options of the PrisonersDilemmaWorlds and factory, 
+    if given, creates the whole world's environment from a world
+    >>> sharded = ShardedWorld(2, seed=1)
+    >>> history = sharded.run(3)
+    >>> [(iteration_no, counts['CHT']) for (iteration_no, counts, food) in history]
+    [(1, 1), (2, 1), (3, 1)]
+    >>> unsharded = world.PrisonersDilemmaWorld(seed=1).create_environment()
+    >>> history[0][1] == unsharded.strategy_counts
+    True
+    >>> ShardedWorld(2, seed=1).run(3) == history
+    True
+    >>> import strategies
+    >>> def factory(xworld):
+    ...     environment = xworld.create_empty_environment()
+    ...     environment.add_critters([
+    ...         critters.Critter(None, strategies.SuckerStrategy())
+    ...         for i in range(10)])
+    ...     return environment
+    >>> ShardedWorld(3, seed=1, factory=factory).run(1)[0][1]
+    {'SCK': 10}
+    
+    a capacity holds for the whole world, not for each shard
+    >>> config = world.WorldConfig(food_required_to_reproduce=8, capacity=13)
+    >>> history = ShardedWorld(3, seed=1, options={'config': config},
+    ...                        factory=factory).run(3)
+    >>> max([sum(counts.values()) for (iteration_no, counts, food) in history])
+    13
+    '''
+    
+    def __init__(self, shards=2, seed=None, options=None, factory=None,
+                 strategy_names=None, migration_rate=MIGRATION_RATE, 
+                 migration_interval=MIGRATION_INTERVAL):
+        self.shards = shards
+        self.seed = seed or 0
+        self.options = options or dict()
+        self.factory = factory
+        self.strategy_names = strategy_names
+        self.migration_rate = migration_rate
+        self.migration_interval = migration_interval
+        self.births = 0
+        self.deaths = 0
+        
+    def run(self, iterations=15):
+        '''
+        runs the shards for a number of iterations and returns the merged
+        history as a list of (iteration_no, counts, food) tuples
+        '''
+        xworld = world.PrisonersDilemmaWorld(seed=self.seed, **self.options)
+        environment = (self.factory or create_environment)(xworld)
+        if self.strategy_names is None:
+            self.strategy_names = sorted(environment.strategy_stats.keys())
+        parts = split_population(environment, self.shards)
+        first_id = (critters.EnvironmentObject.number_of // self.shards + 1
+                    ) * self.shards
+        
+        names = self.strategy_names
+        statistics = multiprocessing.Array('l', self.shards * len(names) * 
+                                           COLUMNS, lock=False)
+        
+        connections = list()
+        processes = list()
+        for index in xrange(self.shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_shard, args=(
+                    worker_connection, index, self.shards, self.seed + index,
+                    self.options, parts[index], first_id, names, statistics, 
+                    self.migration_rate))
+            process.daemon = True
+            process.start()
+            connections.append(connection)
+            processes.append(process)
+        
+        history = list()
+        migrants = [(list(), list()) for index in xrange(self.shards)]
+        try:
+            for iteration_no in xrange(1, iterations + 1):
+                migrate = iteration_no % self.migration_interval == 0
+                for connection, immigrants in zip(connections, migrants):
+                    connection.send(('iterate', immigrants, migrate))
+                
+                #the barrier: every shard has finished the iteration
+                emigrants = [connection.recv() for connection in connections]
+                migrants = emigrants[-1:] + emigrants[:-1]
+                
+                history.append((iteration_no,) + self.merge(statistics))
+        finally:
+            for connection, process in zip(connections, processes):
+                if not process.is_alive():
+                    continue
+                try:
+                    connection.send(('stop', None, False))
+                except (IOError, EOFError):
+                    pass
+            for process in processes:
+                process.join()
+        
+        return history
+    
+    def merge(self, statistics):
+        '''
+        returns the strategy counts and food summed over the shards, adding
+        up the births and deaths too
+        '''
+        names = self.strategy_names
+        counts = dict([(name, 0) for name in names])
+        food = dict([(name, 0) for name in names])
+        births = deaths = 0
+        
+        width = len(names) * COLUMNS
+        for row in xrange(0, self.shards * width, width):
+            for column, name in enumerate(names):
+                cell = row + column * COLUMNS
+                counts[name] += statistics[cell + ALIVE]
+                food[name] += statistics[cell + FOOD]
+                births += statistics[cell + BIRTHS]
+                deaths += statistics[cell + DEATHS]
+        
+        self.births = births
+        self.deaths = deaths
+        return counts, food
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
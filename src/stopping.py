@@ -0,0 +1,148 @@
+'''
+Created on Jul 8, 2011
+
+@author: bendavies
+'''
+
+
+class StoppingCondition(object):
+    '''
+    An archetype for stopping conditions. A world checks its conditions at
+    the end of every iteration and stops running at the first one that gives
+    a reason. Conditions are checked from the environment's live strategy
+    statistics, so checking costs nothing like an iteration
+    '''
+
+    reason = None
+
+    def start(self, environment):
+        '''called before a run's first iteration, to forget earlier runs'''
+        pass
+
+    def check(self, environment):
+        '''returns the reason to stop after this iteration, or None'''
+        return None
+
+    def __repr__(self):
+        return '%s()' % self.__class__.__name__
+
+
+def living_strategies(environment):
+    '''returns the number of strategies with living critters'''
+    return len([statistics for statistics in environment.strategy_stats.values()
+                if statistics.alive])
+
+
+class Extinction(StoppingCondition):
+    '''
+    Stops once every critter has died
+    >>> import environment as env
+    >>> Extinction().check(env.Environment())
+    'extinct'
+    '''
+
+    reason = 'extinct'
+
+    def check(self, environment):
+        if not environment.population:
+            return self.reason
+        return None
+
+
+class SingleStrategy(StoppingCondition):
+    '''
+    Stops once the critters of a single strategy are all that is left, or
+    none are left
+    >>> import environment as env, critters, strategies
+    >>> e = env.Environment()
+    >>> e.add_critter(critters.Critter('c1', strategies.CheatStrategy()))
+    >>> SingleStrategy().check(e)
+    'single strategy'
+    >>> e.add_critter(critters.Critter('s1', strategies.SuckerStrategy()))
+    >>> SingleStrategy().check(e) is None
+    True
+    '''
+
+    reason = 'single strategy'
+
+    def check(self, environment):
+        if living_strategies(environment) <= 1:
+            return self.reason
+        return None
+
+
+class StableShares(StoppingCondition):
+    '''
+    Stops once no strategy's share of the population has moved by more than
+    tolerance for the given number of iterations in a row. Shares only move
+    with births and deaths, so a world in which no critter has yet gathered
+    the food to reproduce or run out of it plateaus too, and is stopped 
+    unless the condition's iterations outlast that start
+    >>> import environment as env, critters, strategies
+    >>> e = env.Environment()
+    >>> e.add_critters([critters.Critter(None, strategies.CheatStrategy()),
+    ...                 critters.Critter(None, strategies.SuckerStrategy())])
+    >>> condition = StableShares(2)
+    >>> condition.start(e)
+    >>> [condition.check(e) for iteration in range(3)]
+    [None, None, 'stable']
+    >>> condition
+    StableShares(2, 0.0)
+    '''
+
+    reason = 'stable'
+
+    def __init__(self, iterations=10, tolerance=0.0):
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.shares = None
+        self.stable = 0
+
+    def start(self, environment):
+        self.shares = None
+        self.stable = 0
+
+    def check(self, environment):
+        size = len(environment.population)
+        if not size:
+            return None
+
+        shares = dict([(name, float(statistics.alive) / size)
+                       for name, statistics
+                       in environment.strategy_stats.items()])
+        previous = self.shares
+        self.shares = shares
+        if previous is None:
+            return None
+
+        tolerance = self.tolerance
+        for name, share in shares.items():
+            if abs(share - previous.get(name, 0.0)) > tolerance:
+                self.stable = 0
+                return None
+        self.stable += 1
+        if self.stable >= self.iterations:
+            return self.reason
+        return None
+
+    def __repr__(self):
+        return 'StableShares(%r, %r)' % (self.iterations, self.tolerance)
+
+
+def default_conditions(stable_iterations=None):
+    '''
+    returns the conditions that stop a run with nothing left to decide:
+    extinction, a single surviving strategy and, given a number of
+    iterations, shares that have stopped moving
+    >>> default_conditions(20)
+    [Extinction(), SingleStrategy(), StableShares(20, 0.0)]
+    '''
+    conditions = [Extinction(), SingleStrategy()]
+    if stable_iterations:
+        conditions.append(StableShares(stable_iterations))
+    return conditions
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -3,15 +3,212 @@ Created on May 24, 2011
 
 @author: bendavies
 '''
+import random
+from collections import deque
 
 #constants
 UNCOOPERATE = 0
 COOPERATE = 1
     
+class LRUMemory(object):
+    '''
+    A mapping that holds at most capacity entries, evicting the least 
+    recently set entry when it is full. Setting and looking up are O(1)
+    >>> memory = LRUMemory(2)
+    >>> memory['c1'] = 0
+    >>> memory['c2'] = 1
+    >>> memory['c1'] = 1
+    >>> memory['c3'] = 0
+    >>> sorted(memory.keys())
+    ['c1', 'c3']
+    >>> memory.get('c2', 'unknown')
+    'unknown'
+    '''
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.values = dict()
+        self.stamps = dict()
+        self.order = deque()
+        self.clock = 0
+        
+    def __len__(self):
+        return len(self.values)
+    
+    def __contains__(self, key):
+        return key in self.values
+    
+    def __getitem__(self, key):
+        return self.values[key]
+    
+    def __setitem__(self, key, value):
+        self.clock += 1
+        self.values[key] = value
+        self.stamps[key] = self.clock
+        self.order.append((key, self.clock))
+        
+        if len(self.values) > self.capacity:
+            self.evict()
+        if len(self.order) > 2 * self.capacity:
+            self.compact()
+            
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+    
+    def keys(self):
+        return self.values.keys()
+    
+    def pop(self, key, default=None):
+        self.stamps.pop(key, None)
+        return self.values.pop(key, default)
+    
+    def evict(self):
+        '''removes the least recently set entry'''
+        stamps = self.stamps
+        while self.order:
+            key, stamp = self.order.popleft()
+            if stamps.get(key) == stamp:
+                del stamps[key]
+                del self.values[key]
+                return
+            
+    def compact(self):
+        '''drops superseded entries from the recency queue'''
+        stamps = self.stamps
+        self.order = deque([(key, stamp) for (key, stamp) in self.order
+                            if stamps.get(key) == stamp])
+    
+
+class PairwiseMemory(object):
+    '''
+    A sparse matrix, shared by a whole environment, of what each critter 
+    remembers about each partner. Entries are keyed by key(critter id, 
+    partner id) in a single dict and hold the partner's state: 
+    PARTNER_COOPERATED is set if the partner's last action was to cooperate 
+    and PARTNER_CHEATED if it has ever failed to. Reactive strategies are 
+    decided by looking the state up in their reactions table
+    >>> memory = PairwiseMemory()
+    >>> memory.record(1, 2, UNCOOPERATE)
+    >>> memory.record(1, 2, COOPERATE)
+    >>> memory.record(3, 2, COOPERATE)
+    >>> memory.state(1, 2), memory.state(3, 2), memory.state(2, 1)
+    (3, 1, 0)
+    >>> TitForTatStrategy.reactions[memory.state(1, 2)]
+    1
+    >>> GrudgerStrategy.reactions[memory.state(1, 2)]
+    0
+    >>> memory.forget(set([2]), population_size=100)
+    >>> len(memory)
+    2
+    >>> memory.forget(set([4, 5]), population_size=8)
+    >>> memory.state(1, 2), len(memory)
+    (0, 0)
+    '''
+    
+    PARTNER_COOPERATED = 1
+    PARTNER_CHEATED = 2
+    
+    #the state after a partner in a given state takes a given action
+    NEXT_STATE = ((2, 1), (2, 1), (2, 3), (2, 3))
+    
+    #critter ids are shifted by this many bits to make room for partner ids
+    KEY_BITS = 32
+    
+    #departed critters are swept out once they number this fraction of the
+    #remaining population
+    SWEEP_FRACTION = 0.25
+    
+    def __init__(self):
+        self.states = dict()
+        self.departed = set()
+        
+    def __len__(self):
+        return len(self.states)
+    
+    def state(self, critter_id, partner_id):
+        '''returns the state of the partner for the critter, 0 if unmet'''
+        return self.states.get(critter_id << self.KEY_BITS | partner_id, 0)
+    
+    def record(self, critter_id, partner_id, partner_action):
+        '''updates the critter's entry with the partner's latest action'''
+        key = critter_id << self.KEY_BITS | partner_id
+        self.states[key] = self.NEXT_STATE[self.states.get(key, 0)][
+            partner_action]
+        
+    def entries_of(self, critter_ids):
+        '''
+        returns the entries the given critters hold about their partners, 
+        to carry them to another memory
+        >>> memory = PairwiseMemory()
+        >>> memory.record(1, 2, COOPERATE)
+        >>> memory.record(2, 1, UNCOOPERATE)
+        >>> [(key >> memory.KEY_BITS, state) 
+        ...  for key, state in memory.entries_of(set([1]))]
+        [(1, 1)]
+        '''
+        shift = self.KEY_BITS
+        return [(key, state) for key, state in self.states.iteritems()
+                if key >> shift in critter_ids]
+    
+    def restore(self, critter_ids, entries):
+        '''
+        adds the entries of critters arriving from another memory. Critters
+        that are back after leaving are no longer marked for removal
+        >>> memory = PairwiseMemory()
+        >>> memory.record(1, 2, COOPERATE)
+        >>> other = PairwiseMemory()
+        >>> other.forget(set([1]), population_size=100)
+        >>> other.restore(set([1]), memory.entries_of(set([1])))
+        >>> other.sweep()
+        >>> other.state(1, 2)
+        1
+        '''
+        self.departed.difference_update(critter_ids)
+        self.states.update(entries)
+    
+    def forget(self, critter_ids, population_size=0):
+        '''
+        marks the entries of the given critters, and about them, for removal.
+        Ids are never reused, so marked entries are never looked up again and
+        are swept out in bulk once enough critters have departed for a walk
+        over the whole memory to pay for itself
+        '''
+        self.departed.update(critter_ids)
+        if len(self.departed) >= population_size * self.SWEEP_FRACTION:
+            self.sweep()
+            
+    def sweep(self):
+        '''drops every entry of or about a departed critter'''
+        departed = self.departed
+        shift = self.KEY_BITS
+        mask = (1 << shift) - 1
+        self.states = dict([(key, state) 
+                            for key, state in self.states.iteritems()
+                            if key >> shift not in departed and 
+                            key & mask not in departed])
+        self.departed = set()
+                    
+
 class AbstractStrategy(object):
     '''A strategy that provides a response to events'''
     
     short_class_name = 'ABS'
+    
+    #whether the strategy keeps a memory of other agents
+    remembers = False
+    
+    #the action to take against a partner in each PairwiseMemory state, for
+    #reactive strategies that can be decided from a shared memory
+    reactions = None
+    
+    #whether the strategy always acts the same way given the same history
+    deterministic = True
+    
+    #the chance of cooperating of a stateless strategy, whose decision 
+    #depends on neither the other agent nor past interactions. Strategies 
+    #with a kernel can be decided without calling interact, and need not
+    #observe interactions. None for strategies that must be asked
+    kernel = None
 
     def get_short_name(self):
         '''
@@ -25,6 +222,16 @@ class AbstractStrategy(object):
 
     short_name = property(get_short_name)
     
+    def get_parameters(self):
+        '''
+        returns the constructor arguments that set the strategy apart from 
+        others of its class
+        >>> CheatStrategy().parameters, RandomStrategy(3).parameters
+        ((), (3,))
+        '''
+        return ()
+    
+    parameters = property(get_parameters)
 
     def interact(self, other_agent):
         '''
@@ -48,6 +255,13 @@ class AbstractStrategy(object):
         '''
         pass
     
+    def forget(self, agent_ids):
+        '''
+        drops anything remembered about the agents with the given ids, 
+        typically because they have left the environment
+        '''
+        pass
+    
     def create_new(self):
         '''
         creates a new version of this strategy inheriting its traits (including
@@ -64,6 +278,7 @@ class CheatStrategy(AbstractStrategy):
     '''A strategy that always fails to cooperate'''
     
     short_class_name = 'CHT'
+    kernel = 0.0
     
     def interact(self, other_agent):
         '''
@@ -78,6 +293,7 @@ class SuckerStrategy(AbstractStrategy):
     '''A strategy that never fails to cooperate'''
     
     short_class_name = 'SCK'
+    kernel = 1.0
     
     def interact(self, other_agent):
         '''
@@ -92,10 +308,17 @@ class RandomStrategy(AbstractStrategy):
     '''A strategy that randomly decides to cooperate or not each time'''
     
     short_class_name = 'RND'
+    deterministic = False
     
-    def __init__(self, cooperation_weight = 1):
+    def __init__(self, cooperation_weight = 1, rng = None):
+        '''
+        constructor. Random draws come from rng, or the random module if no
+        generator is given
+        '''
         self.cooperation_weight = cooperation_weight
         self.chance_to_cooperate = self.calc_coop_chance(cooperation_weight)
+        self.kernel = self.chance_to_cooperate
+        self.random = rng
         super(AbstractStrategy, self).__init__()
     
     def get_short_name(self):
@@ -110,6 +333,12 @@ class RandomStrategy(AbstractStrategy):
 
     short_name = property(get_short_name)
     
+    def get_parameters(self):
+        '''returns the cooperation weight'''
+        return (self.cooperation_weight,)
+    
+    parameters = property(get_parameters)
+    
     def calc_coop_chance(self, coop_weight):
         '''
         determine the chance of cooperation given a cooperation weight and an
@@ -121,9 +350,13 @@ class RandomStrategy(AbstractStrategy):
     
     def create_new(self):
         ''' 
-        Create a new Random Strategy with the same chance to cooperate
+        Create a new Random Strategy with the same chance to cooperate, drawing
+        from the same generator
+        >>> r1 = RandomStrategy(3, random.Random(1))
+        >>> r1.create_new().random is r1.random
+        True
         '''
-        return self.__class__(self.cooperation_weight)
+        return self.__class__(self.cooperation_weight, self.random)
         
     
     def interact(self, other_agent):
@@ -135,10 +368,13 @@ class RandomStrategy(AbstractStrategy):
         >>> random_strategy = RandomStrategy()
         >>> random_strategy.interact(None) # doctest:+ELLIPSIS, +SKIP
         0
+        >>> s1 = RandomStrategy(1, random.Random(2))
+        >>> s2 = RandomStrategy(1, random.Random(2))
+        >>> [s1.interact(None) for i in range(8)] == [s2.interact(None) for i in range(8)]
+        True
         '''
         
-        import random
-        if random.random() <= self.chance_to_cooperate:
+        if (self.random or random).random() <= self.chance_to_cooperate:
             return COOPERATE
         else:
             return UNCOOPERATE
@@ -153,11 +389,13 @@ class GrudgerStrategy(AbstractStrategy):
     '''
     
     short_class_name = 'GRD'
+    remembers = True
+    reactions = (COOPERATE, COOPERATE, UNCOOPERATE, UNCOOPERATE)
     
     def __init__(self):
         ''' constructor'''
         super(GrudgerStrategy,self).__init__()
-        self.agents_to_grudge = list()
+        self.agents_to_grudge = set()
         
     
     def interact(self, other_agent):
@@ -179,7 +417,7 @@ class GrudgerStrategy(AbstractStrategy):
         >>> g.interact(c1)
         0
         '''
-        if self.agents_to_grudge.count(other_agent.name): 
+        if other_agent.id in self.agents_to_grudge: 
             return UNCOOPERATE
         else:
             return COOPERATE
@@ -197,17 +435,32 @@ class GrudgerStrategy(AbstractStrategy):
         >>> grudger_strategy.observe_interaction(grudger, other_critter1, 1, other_critter2, 0)
         >>> grudger_strategy.observe_interaction(grudger, grudger, 1, other_critter2, 0)
         >>> grudger_strategy.observe_interaction(grudger, grudger, 0, other_critter1, 1)
-        >>> grudger_strategy.agents_to_grudge
-        ['c2']
+        >>> grudger_strategy.agents_to_grudge == set([other_critter2.id])
+        True
         '''
-        if agent1.name == me.name:
+        if agent1.id == me.id:
             if agent2_action == UNCOOPERATE:
-                if self.agents_to_grudge.count(agent2.name) == 0:
-                    self.agents_to_grudge.append(agent2.name)
-        elif agent2.name == me.name:
+                self.agents_to_grudge.add(agent2.id)
+        elif agent2.id == me.id:
             if agent1_action == UNCOOPERATE:
-                if self.agents_to_grudge.count(agent1.name) == 0:
-                    self.agents_to_grudge.append(agent1.name)
+                self.agents_to_grudge.add(agent1.id)
+    
+    def forget(self, agent_ids):
+        '''
+        drops grudges against the given agents, walking whichever of the two
+        collections is smaller
+        >>> grudger_strategy = GrudgerStrategy()
+        >>> grudger_strategy.agents_to_grudge.update([1, 2])
+        >>> grudger_strategy.forget(set([1, 3]))
+        >>> grudger_strategy.agents_to_grudge
+        set([2])
+        '''
+        grudges = self.agents_to_grudge
+        if len(agent_ids) < len(grudges):
+            grudges.difference_update(agent_ids)
+        else:
+            self.agents_to_grudge = set([agent_id for agent_id in grudges
+                                         if agent_id not in agent_ids])
  
 class TitForTatStrategy(AbstractStrategy):
     '''
@@ -219,11 +472,34 @@ class TitForTatStrategy(AbstractStrategy):
     '''
     
     short_class_name = 'T4T'
+    remembers = True
+    reactions = (COOPERATE, COOPERATE, UNCOOPERATE, COOPERATE)
     
-    def __init__(self):
-        ''' constructor'''
+    def __init__(self, capacity=None):
+        ''' 
+        constructor. With a capacity only the most recently met agents are
+        remembered
+        '''
         super(TitForTatStrategy,self).__init__()
-        self.last_agent_interaction = dict()
+        self.capacity = capacity
+        if capacity is None:
+            self.last_agent_interaction = dict()
+        else:
+            self.last_agent_interaction = LRUMemory(capacity)
+            
+    def create_new(self):
+        '''
+        Create a new tit for tat strategy with the same capacity
+        >>> TitForTatStrategy(10).create_new().capacity
+        10
+        '''
+        return self.__class__(self.capacity)
+    
+    def get_parameters(self):
+        '''returns the capacity'''
+        return (self.capacity,)
+    
+    parameters = property(get_parameters)
         
     
     def interact(self, other_agent):
@@ -246,10 +522,7 @@ class TitForTatStrategy(AbstractStrategy):
         >>> t.interact(c1)
         1
         '''
-        if self.last_agent_interaction.has_key(other_agent.name): 
-            return self.last_agent_interaction[other_agent.name]
-        else:
-            return COOPERATE
+        return self.last_agent_interaction.get(other_agent.id, COOPERATE)
     
     def observe_interaction(self, me, agent1, agent1_action, agent2, agent2_action):
         '''
@@ -264,15 +537,53 @@ class TitForTatStrategy(AbstractStrategy):
         >>> t4t_strategy.observe_interaction(t4t, other_critter1, 1, other_critter2, 0)
         >>> t4t_strategy.observe_interaction(t4t, t4t, 1, other_critter2, 0)
         >>> t4t_strategy.observe_interaction(t4t, t4t, 0, other_critter1, 1)
-        >>> t4t_strategy.last_agent_interaction
-        {'c2': 0, 'c1': 1}
+        >>> t4t_strategy.last_agent_interaction == {other_critter1.id: 1,
+        ...                                         other_critter2.id: 0}
+        True
+        '''
+        if agent1.id == me.id:
+            self.last_agent_interaction[agent2.id] = agent2_action
+        elif agent2.id == me.id:
+            self.last_agent_interaction[agent1.id] = agent1_action
+            
+    def forget(self, agent_ids):
+        '''
+        drops the last interactions with the given agents
+        >>> t4t_strategy = TitForTatStrategy(5)
+        >>> t4t_strategy.last_agent_interaction[1] = 0
+        >>> t4t_strategy.last_agent_interaction[2] = 1
+        >>> t4t_strategy.forget(set([1]))
+        >>> t4t_strategy.last_agent_interaction.keys()
+        [2]
         '''
-        if agent1.name == me.name:
-            self.last_agent_interaction[agent2.name] = agent2_action
-        elif agent2.name == me.name:
-            self.last_agent_interaction[agent1.name] = agent1_action
+        memory = self.last_agent_interaction
+        if len(agent_ids) < len(memory):
+            for agent_id in agent_ids:
+                memory.pop(agent_id, None)
+        else:
+            for agent_id in [agent_id for agent_id in memory.keys() 
+                             if agent_id in agent_ids]:
+                memory.pop(agent_id)
 
     
+#the known strategies by short class name
+STRATEGY_CLASSES = dict([(strategy_class.short_class_name, strategy_class) 
+                         for strategy_class in (CheatStrategy, SuckerStrategy, 
+                                                RandomStrategy, GrudgerStrategy,
+                                                TitForTatStrategy)])
+
+
+def is_stateless(strategy):
+    '''
+    returns whether the strategy's decisions can be made from its kernel
+    >>> is_stateless(CheatStrategy()), is_stateless(RandomStrategy(3))
+    (True, True)
+    >>> is_stateless(STRATEGY_CLASSES['T4T']())
+    False
+    '''
+    return strategy.kernel is not None
+
+                                                
 if __name__ == '__main__':
     import doctest
     doctest.testmod()    
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+'''
+Created on Jul 6, 2011
+
+@author: bendavies
+'''
+import sys, os, getopt, hashlib, cPickle, tempfile
+import world, runner, stopping
+
+#constants
+CACHE_DIRECTORY = 'sweep-cache'
+
+#bumped whenever a change to the world would change the results of a run,
+#so results cached before it are not used
+CACHE_VERSION = 3
+
+
+def grid(base=None, **axes):
+    '''
+    returns a config for every combination of the axes' values, each axis
+    being a config field and a list of its values. Fields without an axis
+    keep their value in the base config
+    >>> configs = grid(cheater_food=[6, 8], sucker_food=[-1, -2])
+    >>> [(config.cheater_food, config.sucker_food) for config in configs]
+    [(6, -1), (6, -2), (8, -1), (8, -2)]
+    '''
+    configs = [base or world.WorldConfig()]
+    for field in sorted(axes.keys()):
+        if field not in world.WorldConfig.FIELDS:
+            raise ValueError('unknown config field %s' % field)
+        configs = [config.replace(**{field: value})
+                   for config in configs for value in axes[field]]
+    return configs
+
+
+def run_key(config, seed, iterations, options=None):
+    '''
+    returns the cache key of a run: a digest of everything its result
+    depends on
+    >>> run_key(world.WorldConfig(), 1, 10) == run_key(world.WorldConfig(), 1, 10)
+    True
+    >>> run_key(world.WorldConfig(), 1, 10) == run_key(world.WorldConfig(), 2, 10)
+    False
+    '''
+    identity = (CACHE_VERSION, config.key(), seed, iterations,
+                sorted((options or dict()).items()))
+    return hashlib.sha1(repr(identity)).hexdigest()
+
+
+class ResultCache(object):
+    '''
+    Run results kept on disk, one pickle per run key. Results are written to
+    a temporary file that is then renamed, so an interrupted sweep never
+    leaves a partial result behind
+    >>> import shutil
+    >>> directory = tempfile.mkdtemp()
+    >>> cache = ResultCache(directory)
+    >>> cache.get('abc') is None
+    True
+    >>> cache.put('abc', [1, 2])
+    >>> ResultCache(directory).get('abc')
+    [1, 2]
+    >>> shutil.rmtree(directory)
+    '''
+
+    def __init__(self, directory=CACHE_DIRECTORY):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        '''returns the path of the file holding the result of a key'''
+        return os.path.join(self.directory, '%s.pickle' % key)
+
+    def get(self, key):
+        '''returns the cached result of a key, or None'''
+        try:
+            result_file = open(self.path(key), 'rb')
+        except IOError:
+            return None
+        try:
+            return cPickle.load(result_file)
+        finally:
+            result_file.close()
+
+    def put(self, key, result):
+        '''caches the result of a key'''
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+        result_file = os.fdopen(descriptor, 'wb')
+        try:
+            cPickle.dump(result, result_file, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            result_file.close()
+        os.rename(temporary_path, self.path(key))
+
+
+class Sweep(object):
+    '''
+    Runs every config for every seed. Runs whose results are in the cache
+    are not run again, so a sweep that is extended or interrupted only runs
+    what it has not run before. The runs that are needed are spread over a
+    process pool
+    >>> import shutil
+    >>> directory = tempfile.mkdtemp()
+    >>> configs = grid(food_required_to_reproduce=[60, 100])
+    >>> sweep = Sweep(configs, [1, 2], 150, ResultCache(directory), 
+    ...               processes=1)
+    >>> results = sweep.run()
+    >>> len(results), sweep.hits, sweep.misses
+    (4, 0, 4)
+    >>> results[0][3] is None
+    True
+    >>> sweep = Sweep(grid(food_required_to_reproduce=[60, 100, 150]), [1, 2],
+    ...               150, ResultCache(directory), processes=1)
+    >>> again = sweep.run()
+    >>> sweep.hits, sweep.misses
+    (4, 2)
+    >>> again[:4] == results
+    True
+    
+    a cached point is what a fresh run of it gives, whatever ran before
+    >>> config, seed, history, stop_reason = again[3]
+    >>> fresh = runner.run_world(runner.RunSpec(seed, 150, {'config': config}))
+    >>> fresh.history == history, fresh.history[-1][1] == fresh.history[0][1]
+    (True, False)
+    >>> shutil.rmtree(directory)
+    '''
+
+    def __init__(self, configs, seeds, iterations=15, cache=None,
+                 processes=None, options=None):
+        '''
+        Constructor. options are further keyword options for the world,
+        such as its stopping conditions. They are part of each run's key, so
+        their values must have a repr that identifies them
+        '''
+        self.configs = list(configs)
+        self.seeds = list(seeds)
+        self.iterations = iterations
+        self.cache = cache or ResultCache()
+        self.processes = processes
+        self.options = options or dict()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self):
+        '''
+        returns a (config, seed, history, stop_reason) tuple for every 
+        config and seed, in that order
+        '''
+        points = [(config, seed) for config in self.configs
+                  for seed in self.seeds]
+        keys = [run_key(config, seed, self.iterations, self.options)
+                for config, seed in points]
+
+        outcomes = dict()
+        missing = list()
+        for point, key in zip(points, keys):
+            outcome = self.cache.get(key)
+            if outcome is None:
+                missing.append((point, key))
+            else:
+                outcomes[key] = outcome
+        self.hits = len(points) - len(missing)
+        self.misses = len(missing)
+
+        specs = list()
+        for (config, seed), key in missing:
+            options = dict(self.options)
+            options['config'] = config
+            specs.append(runner.RunSpec(seed, self.iterations, options))
+        results = runner.BatchRunner(self.processes).run(specs)
+        for ((point, key), result) in zip(missing, results):
+            outcome = (result.history, result.stop_reason)
+            self.cache.put(key, outcome)
+            outcomes[key] = outcome
+
+        return [(config, seed) + outcomes[key]
+                for (config, seed), key in zip(points, keys)]
+
+
+def summarise(results):
+    '''
+    returns, for every config in the order of results, the config and the
+    strategy counts after the last iteration averaged over its seeds
+    >>> config = world.WorldConfig()
+    >>> summarise([(config, 1, [(1, {'CHT': 2}, {})], None),
+    ...            (config, 2, [(1, {'CHT': 3}, {})], None)]) # doctest:+ELLIPSIS
+    [(WorldConfig(...), {'CHT': 2.5})]
+    '''
+    configs = list()
+    totals = dict()
+    runs = dict()
+    for config, seed, history, stop_reason in results:
+        if config not in totals:
+            configs.append(config)
+            totals[config] = dict()
+            runs[config] = 0
+        runs[config] += 1
+        if not history:
+            continue
+        for strategy, count in history[-1][1].items():
+            totals[config][strategy] = totals[config].get(strategy, 0) + count
+    return [(config, dict([(strategy, float(count) / runs[config])
+                           for strategy, count in totals[config].items()]))
+            for config in configs]
+
+
+def main(argv):
+    axes = dict()
+    seeds = 1
+    iterations = 15
+    directory = CACHE_DIRECTORY
+    processes = None
+    options = dict()
+    try:
+        opts, args = getopt.getopt(argv, 'ha:n:i:d:p:k:',
+                                   ['help', 'axis=', 'seeds=', 'iterations=',
+                                    'cache=', 'processes=', 'stop-stable='])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h','--help'):
+            usage()
+            sys.exit()
+        elif opt in ('-a','--axis'):
+            field, values = arg.split('=')
+            axes[field] = [int(value) for value in values.split(',')]
+        elif opt in ('-n','--seeds'):
+            seeds = int(arg)
+        elif opt in ('-i','--iterations'):
+            iterations = int(arg)
+        elif opt in ('-d','--cache'):
+            directory = arg
+        elif opt in ('-p','--processes'):
+            processes = int(arg)
+        elif opt in ('-k','--stop-stable'):
+            options['stopping_conditions'] = stopping.default_conditions(
+                int(arg))
+
+    sweep = Sweep(grid(**axes), range(seeds), iterations,
+                  ResultCache(directory), processes, options)
+    results = sweep.run()
+    summary = summarise(results)
+
+    fields = sorted(axes.keys())
+    strategies = sorted(set([strategy for config, counts in summary
+                             for strategy in counts]))
+    print '\t'.join(fields + strategies)
+    for config, counts in summary:
+        print '\t'.join(['%d' % getattr(config, field) for field in fields] +
+                        ['%.1f' % counts.get(strategy, 0)
+                         for strategy in strategies])
+    print 'cached runs: %d new runs: %d' % (sweep.hits, sweep.misses)
+    reasons = dict()
+    for config, seed, history, stop_reason in results:
+        if stop_reason is not None:
+            reasons[stop_reason] = reasons.get(stop_reason, 0) + 1
+    for reason in sorted(reasons.keys()):
+        print 'runs stopped early (%s): %d' % (reason, reasons[reason])
+
+
+def usage():
+    '''prints usage instructions'''
+    print('Usage: sweep.py')
+    print('options:')
+    print('-a,axis\tA config field and its values, as field=value,value')
+    print('-n,seeds\tNumber of seeds to run every config with')
+    print('-i,iterations\tNumber of iterations of every run')
+    print('-d,cache\tDirectory of the result cache')
+    print('-p,processes\tNumber of processes to spread the runs over')
+    print('-k,stop-stable\tStop runs once extinct, down to one strategy or '
+          'with shares unchanged for this many iterations')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,199 @@
+'''
+Created on Jun 27, 2011
+
+@author: bendavies
+'''
+import random
+from array import array
+
+
+class Lattice(object):
+    '''
+    A wrapping grid of width x height cells, each holding at most one
+    critter. Two cells are neighbours if they are at most radius cells apart
+    in both directions. Neighbour lists are computed once, as a flat array
+    of degree cell indexes per cell, so finding a critter's neighbours never
+    depends on the size of the grid.
+
+    Critters without a parent are placed in the most recently freed cell, 
+    the free cells of a new lattice being in a random order; offspring are 
+    placed in the nearest free cell to their parent
+    >>> lattice = Lattice(4, 3)
+    >>> lattice.degree, len(lattice)
+    (8, 0)
+    >>> sorted(lattice.neighbours_of(0))
+    [1, 3, 4, 5, 7, 8, 9, 11]
+    '''
+
+    def __init__(self, width, height, radius=1, rng=None):
+        self.width = width
+        self.height = height
+        self.radius = radius
+        self.neighbours, self.degree = self.build_neighbours()
+
+        cells = width * height
+        self.occupant = [None] * cells
+        self.cell_of = dict()
+
+        #free cells, with the position of each in the free list or -1
+        self.free = range(cells)
+        (rng or random).shuffle(self.free)
+        self.free_position = array('i', [0] * cells)
+        for position, cell in enumerate(self.free):
+            self.free_position[cell] = position
+
+    def __len__(self):
+        return len(self.cell_of)
+
+    def build_neighbours(self):
+        '''
+        returns the flat neighbour array and the number of neighbours per
+        cell. On grids too small for the radius, a cell reached twice is
+        listed once and the list is padded with the cell itself, so every
+        cell has the same degree
+        >>> sorted(Lattice(3, 1).neighbours_of(0))
+        [0, 0, 0, 0, 0, 0, 1, 2]
+        '''
+        width, height, radius = self.width, self.height, self.radius
+        offsets = [(dx, dy) for dy in xrange(-radius, radius + 1)
+                   for dx in xrange(-radius, radius + 1)
+                   if (dx, dy) != (0, 0)]
+
+        neighbours = array('i')
+        for y in xrange(height):
+            for x in xrange(width):
+                cell = y * width + x
+                cells = set()
+                for dx, dy in offsets:
+                    neighbour = (y + dy) % height * width + (x + dx) % width
+                    if neighbour in cells or neighbour == cell:
+                        neighbour = cell
+                    cells.add(neighbour)
+                    neighbours.append(neighbour)
+        return neighbours, len(offsets)
+
+    def neighbours_of(self, cell):
+        '''returns the cells neighbouring cell'''
+        start = cell * self.degree
+        return self.neighbours[start:start + self.degree]
+
+    def place(self, critter, near=None):
+        '''
+        places the critter in a free cell, as close to the critter near as
+        the free cells allow. Returns whether there was a free cell
+        >>> from critters import Critter
+        >>> lattice = Lattice(5, 5, rng=random.Random(1))
+        >>> parent, child = Critter('p', None), Critter('c', None)
+        >>> lattice.place(parent), lattice.place(child, parent)
+        (True, True)
+        >>> lattice.cell_of[child.id] in lattice.neighbours_of(
+        ...     lattice.cell_of[parent.id])
+        True
+        >>> small = Lattice(1, 1)
+        >>> small.place(parent), small.place(child)
+        (True, False)
+        '''
+        if not self.free:
+            return False
+
+        cell = None
+        if near is not None:
+            cell = self.free_cell_near(self.cell_of.get(near.id))
+        if cell is None:
+            cell = self.free[-1]
+
+        self.take(cell)
+        self.occupant[cell] = critter
+        self.cell_of[critter.id] = cell
+        return True
+
+    def distance(self, cell, other):
+        '''
+        returns the number of steps between two cells, a step going to a 
+        neighbouring cell
+        >>> lattice = Lattice(10, 10)
+        >>> lattice.distance(0, 1), lattice.distance(0, 9), lattice.distance(0, 55)
+        (1, 1, 5)
+        >>> Lattice(10, 10, radius=2).distance(0, 55)
+        3
+        '''
+        width, height, radius = self.width, self.height, self.radius
+        dx = abs(cell % width - other % width)
+        dy = abs(cell // width - other // width)
+        distance = max(min(dx, width - dx), min(dy, height - dy))
+        return (distance + radius - 1) // radius
+
+    def free_cell_near(self, start):
+        '''
+        returns the free cell closest to the start cell, or None if there is
+        none. The search goes outwards ring by ring through the neighbour 
+        lists for radius * 2 steps; beyond that, on a crowded lattice, the 
+        free cells are few and the nearest of them is found from the free
+        list
+        >>> from critters import Critter
+        >>> lattice = Lattice(10, 1, rng=random.Random(1))
+        >>> critter = Critter(None, None)
+        >>> lattice.place(critter)
+        True
+        >>> start = lattice.cell_of[critter.id]
+        >>> for cell in list(lattice.free):
+        ...     if lattice.distance(start, cell) < 4:
+        ...         lattice.take(cell)
+        ...         lattice.occupant[cell] = critter
+        >>> lattice.distance(start, lattice.free_cell_near(start))
+        4
+        '''
+        if start is None or not self.free:
+            return None
+
+        occupant = self.occupant
+        seen = set([start])
+        ring = [start]
+        for step in xrange(self.radius * 2):
+            next_ring = list()
+            for cell in ring:
+                for neighbour in self.neighbours_of(cell):
+                    if neighbour in seen:
+                        continue
+                    if occupant[neighbour] is None:
+                        return neighbour
+                    seen.add(neighbour)
+                    next_ring.append(neighbour)
+            ring = next_ring
+        
+        distance = self.distance
+        return min(self.free, key=lambda cell: distance(start, cell))
+
+    def take(self, cell):
+        '''removes a cell from the free list'''
+        free = self.free
+        position = self.free_position[cell]
+        last = free.pop()
+        if last != cell:
+            free[position] = last
+            self.free_position[last] = position
+        self.free_position[cell] = -1
+
+    def remove(self, critter):
+        '''
+        frees the critter's cell
+        >>> from critters import Critter
+        >>> lattice = Lattice(2, 2)
+        >>> critter = Critter(None, None)
+        >>> lattice.place(critter)
+        True
+        >>> lattice.remove(critter)
+        >>> len(lattice), len(lattice.free)
+        (0, 4)
+        '''
+        cell = self.cell_of.pop(critter.id, None)
+        if cell is None:
+            return
+        self.occupant[cell] = None
+        self.free_position[cell] = len(self.free)
+        self.free.append(cell)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
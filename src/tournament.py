@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+'''
+Created on Jul 2, 2011
+
+@author: bendavies
+'''
+import sys, getopt, random
+import critters, strategies, world
+
+#constants
+ROUNDS = 200
+
+#scores of matches between deterministic strategies, keyed by both
+#strategies' keys, the number of rounds and the payoffs
+MATCH_CACHE = dict()
+
+
+def strategy_key(strategy):
+    '''
+    returns what identifies a strategy's behaviour: its class and parameters
+    >>> strategy_key(strategies.RandomStrategy(3))
+    ('RandomStrategy', (3,))
+    '''
+    return (strategy.__class__.__name__, strategy.parameters)
+
+
+def default_strategies():
+    '''returns one of each of the strategies of the default world'''
+    return [strategies.SuckerStrategy(), strategies.CheatStrategy(),
+            strategies.RandomStrategy(1), strategies.RandomStrategy(3),
+            strategies.GrudgerStrategy(), strategies.TitForTatStrategy()]
+
+
+class Tournament(object):
+    '''
+    An Axelrod style round robin: every strategy plays every strategy,
+    itself included, for a number of rounds, and scores the food it would
+    have been paid. A strategy's score against itself is the mean of its 
+    two copies' scores. Matches between deterministic strategies always end
+    the same way, so their scores are cached across tournaments and only
+    matches involving a stochastic strategy are played again
+    >>> tournament = Tournament(default_strategies(), rounds=10, seed=1)
+    >>> scores = tournament.play()
+    >>> scores[1][0], scores[0][1]
+    (60, -10)
+    >>> scores[4][1], scores[1][4]
+    (-1, 6)
+    >>> tournament.ranking()[0]
+    ('GRD', 181.0)
+    >>> tournament = Tournament([strategies.RandomStrategy(1)], rounds=50,
+    ...                         seed=1)
+    >>> tournament.play()
+    [[104.5]]
+    >>> Tournament([], rounds=50, seed=1).simulate(strategies.RandomStrategy(1),
+    ...                                            strategies.RandomStrategy(1))
+    (122, 87)
+    '''
+
+    def __init__(self, players, rounds=ROUNDS, seed=None,
+                 payoffs=world.PAYOFF_MATRIX):
+        '''
+        Constructor. players are the strategies to enter, which are copied
+        afresh for every match. Stochastic strategies draw from the
+        tournament's own generator
+        '''
+        self.players = list(players)
+        self.rounds = rounds
+        self.random = random.Random(seed)
+        self.payoffs = payoffs
+        self.scores = None
+
+    def play(self):
+        '''
+        plays every match and returns the score matrix: scores[i][j] is the
+        total player i scored against player j
+        '''
+        size = len(self.players)
+        scores = [[0] * size for i in xrange(size)]
+        for i in xrange(size):
+            score1, score2 = self.match(self.players[i], self.players[i])
+            scores[i][i] = (score1 + score2) / 2.0
+            for j in xrange(i + 1, size):
+                scores[i][j], scores[j][i] = self.match(self.players[i],
+                                                        self.players[j])
+        self.scores = scores
+        return scores
+
+    def match(self, strategy1, strategy2):
+        '''
+        returns both strategies' scores over a match, from the cache if both
+        are deterministic
+        >>> tournament = Tournament([], rounds=5)
+        >>> tournament.match(strategies.GrudgerStrategy(),
+        ...                  strategies.CheatStrategy())
+        (-1, 6)
+        >>> key = (strategy_key(strategies.GrudgerStrategy()),
+        ...        strategy_key(strategies.CheatStrategy()), 5,
+        ...        world.PAYOFF_MATRIX)
+        >>> MATCH_CACHE[key]
+        (-1, 6)
+        '''
+        if not (strategy1.deterministic and strategy2.deterministic):
+            return self.simulate(strategy1, strategy2)
+
+        key = (strategy_key(strategy1), strategy_key(strategy2), self.rounds,
+               self.payoffs)
+        scores = MATCH_CACHE.get(key)
+        if scores is None:
+            scores = MATCH_CACHE[key] = self.simulate(strategy1, strategy2)
+        return scores
+
+    def simulate(self, strategy1, strategy2):
+        '''
+        plays a match between fresh copies of the strategies. Stateless
+        strategies are decided from their kernels as the batched world does
+        '''
+        player1 = critters.Critter(None, strategy1.create_new())
+        player2 = critters.Critter(None, strategy2.create_new())
+        payoffs = self.payoffs
+
+        score1 = score2 = 0
+        for round_no in xrange(self.rounds):
+            action1 = self.decide(player1, player2)
+            action2 = self.decide(player2, player1)
+            score1 += payoffs[action1][action2]
+            score2 += payoffs[action2][action1]
+            if player1.strategy.kernel is None:
+                player1.observe_interaction(player1, action1, player2, action2)
+            if player2.strategy.kernel is None:
+                player2.observe_interaction(player1, action1, player2, action2)
+        return score1, score2
+
+    def decide(self, player, partner):
+        '''returns the player's action towards its partner'''
+        strategy = player.strategy
+        kernel = strategy.kernel
+        if kernel is None:
+            return strategy.interact(partner)
+        elif kernel == 0.0:
+            return strategies.UNCOOPERATE
+        elif kernel == 1.0:
+            return strategies.COOPERATE
+        elif self.random.random() <= kernel:
+            return strategies.COOPERATE
+        else:
+            return strategies.UNCOOPERATE
+
+    def ranking(self):
+        '''returns (short name, total score) for every player, best first'''
+        if self.scores is None:
+            self.play()
+        totals = [(player.short_name, sum(row))
+                  for player, row in zip(self.players, self.scores)]
+        return sorted(totals, key=lambda total: -total[1])
+
+    def report(self):
+        '''
+        returns the score matrix as printable text, with each player's total
+        >>> tournament = Tournament([strategies.CheatStrategy(),
+        ...                          strategies.SuckerStrategy()], rounds=2)
+        >>> print tournament.report()
+                CHT     SCK     total
+        CHT     0       12      12
+        SCK     -2      8       6
+        '''
+        if self.scores is None:
+            self.play()
+        names = [player.short_name for player in self.players]
+        lines = ['\t%s\ttotal' % '\t'.join(names)]
+        for name, row in zip(names, self.scores):
+            lines.append('%s\t%s\t%g' % (name, '\t'.join(['%g' % score
+                                                         for score in row]),
+                                         sum(row)))
+        return '\n'.join(lines).expandtabs()
+
+
+def main(argv):
+    rounds = ROUNDS
+    seed = None
+    try:
+        opts, args = getopt.getopt(argv, 'hr:s:', ['help', 'rounds=', 'seed='])
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ('-h','--help'):
+            usage()
+            sys.exit()
+        elif opt in ('-r','--rounds'):
+            rounds = int(arg)
+        elif opt in ('-s','--seed'):
+            seed = int(arg)
+
+    print Tournament(default_strategies(), rounds, seed).report()
+
+
+def usage():
+    '''prints usage instructions'''
+    print('Usage: tournament.py')
+    print('options:')
+    print('-r,rounds\tNumber of rounds in each match')
+    print('-s,seed\tSeed of the stochastic strategies')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -3,31 +3,178 @@ Created on May 21, 2011
 
 @author: bendavies
 '''
-import random
-import critters, strategies, environment as env
+import random, time
+from itertools import izip
+import critters, strategies, pairing, population, plugins, checkpoint
+import environment as env
+
+#payoffs
+COOPERATE_FOOD = 4
+CHEATER_FOOD = 6
+SUCKER_FOOD = -1
+PASSIVE_FOOD = 0
+
+#food received, indexed by [own action][other action]
+PAYOFF_MATRIX = ((PASSIVE_FOOD, CHEATER_FOOD),
+                 (SUCKER_FOOD, COOPERATE_FOOD))
+
+
+class WorldConfig(object):
+    '''
+    The numbers that set the rules of a world: the payoffs, how many 
+    partners each critter picks, the food consumed every iteration, the
+    food needed to reproduce and the capacity of the environment, with how
+    critters beyond it are culled. Each defaults to its module constant, 
+    and there is no capacity unless one is given
+    >>> config = WorldConfig(cheater_food=8)
+    >>> config.payoff_matrix()
+    ((0, 8), (-1, 4))
+    >>> config == WorldConfig(cheater_food=8), config == WorldConfig()
+    (True, False)
+    '''
+    
+    FIELDS = ('cooperate_food', 'cheater_food', 'sucker_food', 'passive_food',
+              'number_of_interactions', 'iteration_food_consumption',
+              'food_required_to_reproduce', 'capacity', 'cull_policy')
+    
+    def __init__(self, cooperate_food=COOPERATE_FOOD, 
+                 cheater_food=CHEATER_FOOD, sucker_food=SUCKER_FOOD, 
+                 passive_food=PASSIVE_FOOD, 
+                 number_of_interactions=pairing.NUMBER_OF_INTERACTIONS,
+                 iteration_food_consumption=env.ITERATION_FOOD_CONSUMPTION,
+                 food_required_to_reproduce=
+                 critters.Critter.FOOD_REQUIRED_TO_REPRODUCE,
+                 capacity=None, cull_policy=env.CULL_RANDOM):
+        self.cooperate_food = cooperate_food
+        self.cheater_food = cheater_food
+        self.sucker_food = sucker_food
+        self.passive_food = passive_food
+        self.number_of_interactions = number_of_interactions
+        self.iteration_food_consumption = iteration_food_consumption
+        self.food_required_to_reproduce = food_required_to_reproduce
+        self.capacity = capacity
+        self.cull_policy = cull_policy
+        
+    def payoff_matrix(self):
+        '''returns the food received, indexed by [own action][other action]'''
+        return ((self.passive_food, self.cheater_food),
+                (self.sucker_food, self.cooperate_food))
+    
+    def key(self):
+        '''
+        returns a tuple of (field, value) pairs identifying the config
+        >>> WorldConfig().key()[0]
+        ('cooperate_food', 4)
+        '''
+        return tuple([(field, getattr(self, field)) for field in self.FIELDS])
+    
+    def replace(self, **changes):
+        '''
+        returns a copy of the config with some fields changed
+        >>> WorldConfig().replace(sucker_food=-2).sucker_food
+        -2
+        '''
+        values = dict(self.key())
+        values.update(changes)
+        return WorldConfig(**values)
+    
+    def __eq__(self, other):
+        return isinstance(other, WorldConfig) and self.key() == other.key()
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return hash(self.key())
+    
+    def __repr__(self):
+        return 'WorldConfig(%s)' % ', '.join(['%s=%r' % item 
+                                              for item in self.key()])
+    
+
+class InteractionBatch(object):
+    '''
+    The interactions of one iteration as a columnar record: parallel lists
+    of the first agents, their actions, the second agents and their actions
+    >>> batch = InteractionBatch(['c1'], [0], ['s1'], [1])
+    >>> len(batch)
+    1
+    >>> list(batch)
+    [('c1', 0, 's1', 1)]
+    '''
+    
+    def __init__(self, agent1, agent1_outcome, agent2, agent2_outcome):
+        self.agent1 = agent1
+        self.agent1_outcome = agent1_outcome
+        self.agent2 = agent2
+        self.agent2_outcome = agent2_outcome
+        
+    def __len__(self):
+        return len(self.agent1)
+    
+    def __iter__(self):
+        '''iterates over (agent1, agent1_outcome, agent2, agent2_outcome) rows'''
+        return izip(self.agent1, self.agent1_outcome, 
+                    self.agent2, self.agent2_outcome)
+    
 
 class World(object):
     '''
     abstract class for defining the rules and actions of an environment
     '''
 
-    def __init__(self):
+    def __init__(self, seed=None):
         '''
-        Constructor
+        Constructor. The world owns the random number generator used for
+        everything random within it, so a seeded world is reproducible
+        >>> World(3).random.random() == World(3).random.random()
+        True
         '''
         self.plugins = list()
+        self.subscribers = dict([(hook, list()) for hook in plugins.HOOKS])
+        self.unsubscribed = dict([(hook, list()) for hook in plugins.HOOKS])
+        self.iteration_plugins = list()
+        self.verbose = True
+        self.random = random.Random(seed)
+        self.checkpoint_path = None
+        self.checkpoint_interval = 1000
+        self.stats = None
     
     def add_plugin(self, plugin):
-        '''Adds a plugin
-        >>> import plugins
+        '''Adds a plugin. It is only sent the events it implements a hook for
         >>> world = World()
         >>> len(world.plugins)
         0
         >>> world.add_plugin(plugins.EventPlugin())
         >>> len(world.plugins)
         1
+        >>> world.add_plugin(plugins.StrategyTabularReporter())
+        >>> len(world.subscribers['on_iteration_end'])
+        1
+        >>> len(world.subscribers['on_interaction_end'])
+        0
         '''
         self.plugins.append(plugin)
+        hooks = plugins.implemented_hooks(plugin)
+        for hook in hooks:
+            self.subscribers[hook].append(plugin)
+        if [hook for hook in hooks if hook in plugins.ITERATION_HOOKS]:
+            self.iteration_plugins.append(plugin)
+            
+    def observed(self, iteration_no):
+        '''
+        returns whether any plugin observes the iteration
+        >>> world = World()
+        >>> world.observed(1)
+        False
+        >>> world.add_plugin(plugins.StrategyTabularReporter(5))
+        >>> world.observed(4), world.observed(5)
+        (False, True)
+        '''
+        for plugin in self.iteration_plugins:
+            if plugin.observes(iteration_no):
+                return True
+        return False
         
         
     def run(self):
@@ -36,33 +183,49 @@ class World(object):
         '''
         return 0
     
+    def save_checkpoint(self, environment):
+        '''snapshots the environment and random state to the checkpoint path'''
+        checkpoint.save_checkpoint(self.checkpoint_path, self, environment)
+        
+    def resume(self, path):
+        '''restores the random state from a checkpoint and returns its 
+        environment'''
+        environment = checkpoint.load_checkpoint(path, self)
+        if environment.topology is not None:
+            self.pairing_engine.topology = environment.topology
+        return environment
         
     def send_environment_start(self, environment):
         '''triggers environment start events in registered plugins'''
-        for plugin in self.plugins:
+        for plugin in self.subscribers['on_environment_start']:
             plugin.on_environment_start(environment)
         
     def send_environment_end(self, environment):
         '''triggers environment end events in registered plugins'''
-        for plugin in self.plugins:
+        for plugin in self.subscribers['on_environment_end']:
             plugin.on_environment_end(environment)
         
     def send_iteration_start(self, environment):
         '''sends iteration start events in registered plugins'''
-        for plugin in self.plugins:
+        for plugin in self.subscribers['on_iteration_start']:
             plugin.on_iteration_start(environment)
     
     def send_iteration_end(self, environment):
         '''sends iteration end events in registered plugins'''
-        for plugin in self.plugins:
+        for plugin in self.subscribers['on_iteration_end']:
             plugin.on_iteration_end(environment)
 
     def send_interaction_end(self, environment, agent1, agent1_outcome, agent2, agent2_outcome):
         '''send interaction end events to registered plugins'''
-        for plugin in self.plugins:
+        for plugin in self.subscribers['on_interaction_end']:
             plugin.on_interaction_end(environment, 
                                       agent1, agent1_outcome,
                                       agent2, agent2_outcome)
+            
+    def send_interactions_end(self, environment, batch):
+        '''send an iteration's batch of interactions to registered plugins'''
+        for plugin in self.subscribers['on_interactions_end']:
+            plugin.on_interactions_end(environment, batch)
     
     
 class  PrisonersDilemmaWorld(World):
@@ -72,48 +235,265 @@ class  PrisonersDilemmaWorld(World):
     decisions they are provided food
     '''
     
-    def run(self, iterations=15):
+    def __init__(self, pairing_engine=None, batched=False, compact=False,
+                 seed=None, shared_memory=False, config=None,
+                 stopping_conditions=None):
+        '''
+        Constructor. The pairing engine decides who interacts with whom and
+        defaults to fully random mixing. A batched world resolves all of an
+        iteration's interactions together (see interact_critters_batch). A
+        compact world keeps critter state in a population store. With a 
+        shared memory, reactive strategies are decided from a pairwise memory
+        owned by the environment. The config sets the payoffs and food rules.
+        A run stops early at the first of the stopping conditions that is
+        met, and the world's stop_reason says which
+        >>> PrisonersDilemmaWorld().pairing_engine # doctest:+ELLIPSIS
+        <pairing.RandomPairing object at ...>
+        >>> config = WorldConfig(number_of_interactions=2, cheater_food=7)
+        >>> world = PrisonersDilemmaWorld(config=config)
+        >>> world.pairing_engine.number_of_interactions, world.payoffs[0][1]
+        (2, 7)
+        '''
+        super(PrisonersDilemmaWorld, self).__init__(seed)
+        self.config = config or WorldConfig()
+        self.payoffs = self.config.payoff_matrix()
+        self.pairing_engine = pairing_engine or pairing.RandomPairing(
+            self.config.number_of_interactions)
+        self.batched = batched
+        self.compact = compact
+        self.shared_memory = shared_memory
+        self.stopping_conditions = list(stopping_conditions or ())
+        self.stop_reason = None
+    
+    def run(self, iterations=15, environment=None):
         '''
-        executes the world
+        executes the world until the environment has seen the given number of
+        iterations. Without an environment a new one is created. If a 
+        checkpoint path is set, the environment is checkpointed every 
+        checkpoint_interval iterations. If the world has a RunStats object,
+        each phase of every iteration is timed; plugins can read it as
+        environment.stats. The world's config is applied to the environment
+        first. The run ends early if a stopping condition is met
         >>> world = PrisonersDilemmaWorld()
         >>> world.run() # doctest:+ELLIPSIS
         simulation is commencing.
         simulation has finished.
+        >>> import stopping
+        >>> world = PrisonersDilemmaWorld(seed=1, stopping_conditions=[
+        ...     stopping.StableShares(3)], 
+        ...     config=WorldConfig(food_required_to_reproduce=40))
+        >>> world.verbose = False
+        >>> environment = world.create_environment()
+        >>> world.run(100, environment)
+        >>> world.stop_reason, environment.iteration_no, environment.births
+        ('stable', 41, 58)
         '''
         
-        print 'simulation is commencing.'
+        if self.verbose:
+            print 'simulation is commencing.'
         
-        #create environment and critters to populate it
-        environment = env.Environment()
+        if environment is None:
+            environment = self.create_environment()
+        self.apply_config(environment)
         
-        sucker = critters.Critter('s1', strategies.SuckerStrategy())
-        cheater = critters.Critter('c1', strategies.CheatStrategy())
-        random = critters.Critter('r1', strategies.RandomStrategy())
-        random2 = critters.Critter('r2', strategies.RandomStrategy(3))
-        grudger = critters.Critter('g1', strategies.GrudgerStrategy())
-        titter = critters.Critter('t1', strategies.TitForTatStrategy())
+        stats = self.stats
+        environment.stats = stats
         
-        environment.add_critters((sucker, cheater, random, random2, grudger, titter))
+        self.stop_reason = None
+        for condition in self.stopping_conditions:
+            condition.start(environment)
         
         self.send_environment_start(environment)
         
         #execute iterations
-        for i in range(iterations):
+        while (environment.iteration_no < iterations and 
+               self.stop_reason is None):
+            
+            if stats is None and not self.observed(environment.iteration_no + 1):
+                self.fast_forward(environment, iterations)
+                continue
 
             environment.start_iteration()
             
-            self.send_iteration_start(environment)
-            
-            self.run_iteration(environment)
+            if stats is None:
+                self.send_iteration_start(environment)
+                
+                self.run_iteration(environment)
+                
+                self.send_iteration_end(environment)
+                
+                environment.end_iteration()
+            else:
+                self.run_profiled_iteration(environment, stats)
             
-            self.send_iteration_end(environment)
+            if (self.checkpoint_path and 
+                environment.iteration_no % self.checkpoint_interval == 0):
+                self.save_checkpoint(environment)
             
-            environment.end_iteration()
+            if self.stopping_conditions:
+                self.check_stopping(environment)
                  
         self.send_environment_end(environment)    
         
         #finish simulation
-        print('simulation has finished.')
+        if self.verbose:
+            if self.stop_reason is not None:
+                print('simulation stopped after iteration %d: %s.' % 
+                      (environment.iteration_no, self.stop_reason))
+            print('simulation has finished.')
+    
+    def check_stopping(self, environment):
+        '''
+        sets stop_reason to the reason of the first stopping condition that
+        is met, and returns whether one was
+        '''
+        for condition in self.stopping_conditions:
+            reason = condition.check(environment)
+            if reason is not None:
+                self.stop_reason = reason
+                return True
+        return False
+            
+    def fast_forward(self, environment, iterations):
+        '''
+        runs iterations that no plugin observes in a tight loop without any
+        plugin calls, until the next observed iteration, the given number
+        of iterations or a stopping condition. Checkpoints are still taken.
+        The results are the same as those of run
+        >>> def final_counts(plugin):
+        ...     world = PrisonersDilemmaWorld(seed=4)
+        ...     world.verbose = False
+        ...     world.add_plugin(plugin)
+        ...     environment = world.create_environment()
+        ...     world.run(40, environment)
+        ...     return environment.strategy_totals()
+        >>> class Watcher(plugins.EventPlugin):
+        ...     def on_iteration_end(self, environment):
+        ...         pass
+        >>> class Sampler(Watcher):
+        ...     def observes(self, iteration_no):
+        ...         return iteration_no % 10 == 0
+        >>> final_counts(Watcher()) == final_counts(Sampler())
+        True
+        '''
+        subscribers = self.subscribers
+        self.subscribers = self.unsubscribed
+        try:
+            while (environment.iteration_no < iterations and
+                   not self.observed(environment.iteration_no + 1)):
+                environment.start_iteration()
+                self.run_iteration(environment)
+                environment.end_iteration()
+                
+                if (self.checkpoint_path and 
+                    environment.iteration_no % self.checkpoint_interval == 0):
+                    self.save_checkpoint(environment)
+                
+                if self.stopping_conditions and self.check_stopping(environment):
+                    break
+        finally:
+            self.subscribers = subscribers
+    
+    def run_profiled_iteration(self, environment, stats):
+        '''
+        runs an iteration as run does, timing each of its phases
+        >>> import profiling
+        >>> world = PrisonersDilemmaWorld(seed=1)
+        >>> world.verbose = False
+        >>> world.stats = profiling.RunStats()
+        >>> world.run(3)
+        >>> sorted(world.stats.totals.keys()) # doctest:+NORMALIZE_WHITESPACE
+        ['decisions', 'end_iteration', 'observations', 'pairing', 'payoffs', 
+         'plugins']
+        >>> world.stats.totals['pairing'][1]
+        3
+        '''
+        stats.start('plugins')
+        self.send_iteration_start(environment)
+        stats.stop()
+        
+        self.run_iteration(environment)
+        
+        stats.start('plugins')
+        self.send_iteration_end(environment)
+        stats.stop()
+        
+        stats.start('end_iteration')
+        environment.end_iteration()
+        stats.stop()
+        
+        stats.end_iteration()
+            
+    def apply_config(self, environment):
+        '''
+        sets the environment's food rules and capacity from the world's 
+        config. run does this for every environment it is given, so the
+        config holds whoever built the environment
+        >>> config = WorldConfig(iteration_food_consumption=1, capacity=1)
+        >>> world = PrisonersDilemmaWorld(seed=1, config=config)
+        >>> world.verbose = False
+        >>> environment = env.Environment()
+        >>> environment.add_critters([
+        ...     critters.Critter(None, strategies.CheatStrategy())
+        ...     for i in range(3)])
+        >>> world.run(2, environment)
+        >>> len(environment.population), environment.culled
+        (1, 2)
+        >>> environment.population.values()[0].food
+        3
+        '''
+        config = self.config
+        environment.food_consumption = config.iteration_food_consumption
+        environment.food_required_to_reproduce = (
+            config.food_required_to_reproduce)
+        environment.capacity = config.capacity
+        environment.cull_policy = config.cull_policy
+        environment.rng = self.random
+    
+    def create_empty_environment(self):
+        '''
+        creates an environment without critters, with the population store,
+        pairwise memory and topology the world's options call for
+        >>> environment = PrisonersDilemmaWorld(compact=True).create_empty_environment()
+        >>> len(environment.population), environment.store is not None
+        (0, True)
+        '''
+        store = memory = None
+        if self.compact:
+            store = population.PopulationStore()
+        if self.shared_memory:
+            memory = strategies.PairwiseMemory()
+        topology = self.pairing_engine.create_topology(self.random)
+        environment = env.Environment(store, memory, topology)
+        self.apply_config(environment)
+        return environment
+    
+    def create_environment(self):
+        '''
+        creates the environment and the critters to populate it
+        >>> config = WorldConfig(food_required_to_reproduce=100, capacity=30,
+        ...                      cull_policy=env.CULL_OLDEST)
+        >>> world = PrisonersDilemmaWorld(seed=1, config=config)
+        >>> world.verbose = False
+        >>> environment = world.create_environment()
+        >>> world.run(40, environment)
+        >>> len(environment.population), environment.culled > 0
+        (30, True)
+        '''
+        environment = self.create_empty_environment()
+        
+        sucker = critters.Critter('s1', strategies.SuckerStrategy())
+        cheater = critters.Critter('c1', strategies.CheatStrategy())
+        random = critters.Critter('r1', 
+                                  strategies.RandomStrategy(1, self.random))
+        random2 = critters.Critter('r2', 
+                                   strategies.RandomStrategy(3, self.random))
+        grudger = critters.Critter('g1', strategies.GrudgerStrategy())
+        titter = critters.Critter('t1', strategies.TitForTatStrategy())
+        
+        environment.add_critters((sucker, cheater, random, random2, grudger, titter))
+        
+        return environment
 
     def run_iteration(self, environment):
         '''
@@ -125,97 +505,107 @@ class  PrisonersDilemmaWorld(World):
         >>> environment = env.Environment()
         >>> environment.add_critters((c1,c2))
         >>> world.run_iteration(environment)
-        >>> environment.population['c1'].food
+        >>> c1.food
+        5
+        >>> world = PrisonersDilemmaWorld(batched=True)
+        >>> world.run_iteration(environment)
+        >>> c2.food
         5
 
         '''
+        stats = self.stats
     
-        interaction_list = self.determine_interactions(environment.population)
+        if stats is not None:
+            stats.start('pairing')
+        interaction_list = self.determine_interactions(
+            environment.ordered_critters())
         #print [(c1.name,c2.name) for (c1,c2) in interaction_list]
+        if stats is not None:
+            stats.stop()
         
-        for (c1, c2) in interaction_list:
-            self.interact_critters(environment, c1,c2)
-
-    def determine_interactions(self, population):
-        '''determines which interactions will happen within the population'''
-        
-        NUMBER_OF_INTERACTIONS = 5
+        if self.batched:
+            actions1, actions2 = self.interact_critters_batch(environment,
+                                                              interaction_list)
+        elif stats is not None:
+            actions1, actions2 = self.interact_critters_profiled(
+                environment, interaction_list, stats)
+        else:
+            outcomes = [self.interact_critters(environment, c1, c2)
+                        for (c1, c2) in interaction_list]
+            actions1 = [a1 for (a1, a2) in outcomes]
+            actions2 = [a2 for (a1, a2) in outcomes]
         
-        interactions = list()
-        for critter in population.values():
-            
-            critters_to_interact_with = list(population.values())
-            critters_to_interact_with.remove(critter)
-            
-            for i in range(0, NUMBER_OF_INTERACTIONS):
-                
-                if len(critters_to_interact_with) > 0:
-                
-                    other_critter = random.choice(critters_to_interact_with)
-                    if (critter.name < other_critter.name and(critter,other_critter) not in interactions) or\
-                        (other_critter.name > critter.name and (other_critter, critter) not in interactions):
-                        
-                        if critter.name < other_critter.name:
-                            interactions.append((critter, other_critter))
-                        else:
-                            interactions.append((other_critter, critter))
-                        
-                        critters_to_interact_with.remove(other_critter)
-                          
-        return interactions
+        if self.subscribers['on_interactions_end']:
+            if stats is not None:
+                stats.start('plugins')
+            self.send_interactions_end(environment, InteractionBatch(
+                    [c1 for (c1, c2) in interaction_list], actions1,
+                    [c2 for (c1, c2) in interaction_list], actions2))
+            if stats is not None:
+                stats.stop()
+
+    def determine_interactions(self, critters):
+        '''
+        determines which interactions will happen between the critters, 
+        given in the order the environment keeps them
+        '''
+        return self.pairing_engine.determine_interactions(critters, 
+                                                          self.random)
 
 
     def interact_critters(self, environment, critter1, critter2):
         '''
         executes an interaction between 2 critters. Based on their own 
         response to the interaction, each is rewarded food (or not) based on 
-        their response
+        their response. Returns both critters' actions
         >>> world = PrisonersDilemmaWorld()
         >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
         >>> s1 = critters.Critter('s1', strategies.SuckerStrategy())
         >>> world.interact_critters(None,c1,s1)
+        (0, 1)
         >>> c1.food
         35
         >>> s1.food
         4
         
         '''
-        COOPERATE_FOOD = 4
-        CHEATER_FOOD = 6
-        SUCKER_FOOD = -1
-        PASSIVE_FOOD = 0
-        
         COOPERATE = strategies.COOPERATE
         UNCOOPERATE = strategies.UNCOOPERATE
         
+        memory = environment and environment.memory
+        if memory is not None:
+            return self.interact_critters_remembered(environment, memory,
+                                                     critter1, critter2)
         
         critter1_interaction = critter1.interact(critter2)
         critter2_interaction = critter2.interact(critter1)
         
+        payoffs = self.payoffs
+        
         if (critter1_interaction == COOPERATE and 
             critter2_interaction == COOPERATE):
     
-            critter1.add_food(COOPERATE_FOOD)
-            critter2.add_food(COOPERATE_FOOD)
+            critter1.add_food(payoffs[COOPERATE][COOPERATE])
+            critter2.add_food(payoffs[COOPERATE][COOPERATE])
             
         elif (critter1_interaction == UNCOOPERATE and
                  critter2_interaction == UNCOOPERATE):
             #neither gets food
     
-            critter1.add_food(PASSIVE_FOOD)
-            critter2.add_food(PASSIVE_FOOD)                
+            critter1.add_food(payoffs[UNCOOPERATE][UNCOOPERATE])
+            critter2.add_food(payoffs[UNCOOPERATE][UNCOOPERATE])
         else:
             #one cheated the other
     
             if critter1_interaction == COOPERATE:
                 #critter1 is the sucker
-                critter1.add_food(SUCKER_FOOD)
-                critter2.add_food(CHEATER_FOOD)
+                critter1.add_food(payoffs[COOPERATE][UNCOOPERATE])
+                critter2.add_food(payoffs[UNCOOPERATE][COOPERATE])
     
             else:
                 #critter2 is the sucker
-                critter2.add_food(SUCKER_FOOD)
-                critter1.add_food(CHEATER_FOOD)
+                critter2.add_food(payoffs[COOPERATE][UNCOOPERATE])
+                critter1.add_food(payoffs[UNCOOPERATE][COOPERATE])
     
         #Critters observe the outcome
         critter1.observe_interaction(critter1,critter1_interaction,
@@ -224,9 +614,271 @@ class  PrisonersDilemmaWorld(World):
                                      critter2,critter2_interaction)
         
         #So do plugins!
-        self.send_interaction_end(environment,
-                                  critter1,critter1_interaction,
-                                  critter2,critter2_interaction)
+        if self.subscribers['on_interaction_end']:
+            self.send_interaction_end(environment,
+                                      critter1,critter1_interaction,
+                                      critter2,critter2_interaction)
+        
+        return critter1_interaction, critter2_interaction
+    
+    def interact_critters_remembered(self, environment, memory, 
+                                     critter1, critter2):
+        '''
+        executes an interaction as interact_critters does, deciding and 
+        recording reactive strategies in the environment's pairwise memory
+        >>> world = PrisonersDilemmaWorld()
+        >>> environment = env.Environment(memory=strategies.PairwiseMemory())
+        >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
+        >>> t1 = critters.Critter('t1', strategies.TitForTatStrategy())
+        >>> environment.add_critters((c1, t1))
+        >>> world.interact_critters(environment, c1, t1)
+        (0, 1)
+        >>> world.interact_critters(environment, c1, t1)
+        (0, 0)
+        >>> t1.strategy.last_agent_interaction
+        {}
+        '''
+        payoffs = self.payoffs
+        
+        reactions1 = critter1.strategy.reactions
+        reactions2 = critter2.strategy.reactions
+        if reactions1 is None:
+            action1 = critter1.interact(critter2)
+        else:
+            action1 = reactions1[memory.state(critter1.id, critter2.id)]
+        if reactions2 is None:
+            action2 = critter2.interact(critter1)
+        else:
+            action2 = reactions2[memory.state(critter2.id, critter1.id)]
+        
+        critter1.add_food(payoffs[action1][action2])
+        critter2.add_food(payoffs[action2][action1])
+        
+        if reactions1 is None:
+            critter1.observe_interaction(critter1, action1, critter2, action2)
+        else:
+            memory.record(critter1.id, critter2.id, action2)
+        if reactions2 is None:
+            critter2.observe_interaction(critter1, action1, critter2, action2)
+        else:
+            memory.record(critter2.id, critter1.id, action1)
+        
+        if self.subscribers['on_interaction_end']:
+            self.send_interaction_end(environment, critter1, action1,
+                                      critter2, action2)
+        
+        return action1, action2
+
+    def interact_critters_profiled(self, environment, interactions, stats):
+        '''
+        executes the interactions one at a time exactly as interact_critters
+        does, timing the decisions, payoffs, observations and plugin calls
+        of each and adding them up into a phase apiece. Returns the lists of
+        first and second critters' actions
+        >>> import profiling
+        >>> world = PrisonersDilemmaWorld()
+        >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
+        >>> s1 = critters.Critter('s1', strategies.SuckerStrategy())
+        >>> stats = profiling.RunStats()
+        >>> world.interact_critters_profiled(None, [(c1, s1), (s1, c1)], stats)
+        ([0, 1], [1, 0])
+        >>> c1.food, s1.food
+        (17, 3)
+        >>> sorted(stats.current.keys())
+        ['decisions', 'observations', 'payoffs', 'plugins']
+        '''
+        COOPERATE = strategies.COOPERATE
+        UNCOOPERATE = strategies.UNCOOPERATE
+        clock = time.time
+        payoffs = self.payoffs
+        memory = environment and environment.memory
+        observed = self.subscribers['on_interaction_end']
+        
+        actions1 = list()
+        actions2 = list()
+        deciding = paying = observing = notifying = 0.0
+        reactions1 = reactions2 = None
+        for critter1, critter2 in interactions:
+            started = clock()
+            if memory is not None:
+                reactions1 = critter1.strategy.reactions
+                reactions2 = critter2.strategy.reactions
+            if reactions1 is None:
+                action1 = critter1.interact(critter2)
+            else:
+                action1 = reactions1[memory.state(critter1.id, critter2.id)]
+            if reactions2 is None:
+                action2 = critter2.interact(critter1)
+            else:
+                action2 = reactions2[memory.state(critter2.id, critter1.id)]
+            decided = clock()
+            
+            #credited in the order interact_critters credits them
+            if (memory is None and action1 == UNCOOPERATE and 
+                action2 == COOPERATE):
+                critter2.add_food(payoffs[action2][action1])
+                critter1.add_food(payoffs[action1][action2])
+            else:
+                critter1.add_food(payoffs[action1][action2])
+                critter2.add_food(payoffs[action2][action1])
+            paid = clock()
+            
+            if reactions1 is None:
+                critter1.observe_interaction(critter1, action1, 
+                                             critter2, action2)
+            else:
+                memory.record(critter1.id, critter2.id, action2)
+            if reactions2 is None:
+                critter2.observe_interaction(critter1, action1, 
+                                             critter2, action2)
+            else:
+                memory.record(critter2.id, critter1.id, action1)
+            observed_at = clock()
+            
+            if observed:
+                self.send_interaction_end(environment, critter1, action1,
+                                          critter2, action2)
+            finished = clock()
+            
+            deciding += decided - started
+            paying += paid - decided
+            observing += observed_at - paid
+            notifying += finished - observed_at
+            actions1.append(action1)
+            actions2.append(action2)
+        
+        stats.add('decisions', deciding)
+        stats.add('payoffs', paying)
+        stats.add('observations', observing)
+        stats.add('plugins', notifying)
+        return actions1, actions2
+    
+    def interact_critters_batch(self, environment, interactions):
+        '''
+        executes a list of interactions together. All critters decide first,
+        payoffs are then looked up in the world's payoff matrix and each 
+        critter is credited its summed payoff once, and finally the critters
+        and plugins observe the outcomes in interaction order. Unlike interact_critters, no
+        critter can react to an outcome from the same batch. Returns the lists
+        of first and second critters' actions
+        >>> world = PrisonersDilemmaWorld()
+        >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
+        >>> c2 = critters.Critter('c2', strategies.CheatStrategy())
+        >>> s1 = critters.Critter('s1', strategies.SuckerStrategy())
+        >>> world.interact_critters_batch(None, [(c1, s1), (c2, s1)])
+        ([0, 0], [1, 1])
+        >>> c1.food, c2.food, s1.food
+        (11, 11, 3)
+        '''
+        payoffs = self.payoffs
+        stats = self.stats
+        
+        #gather the actions
+        if stats is not None:
+            stats.start('decisions')
+        memory = environment and environment.memory
+        actions1 = self.decide_actions(interactions, memory)
+        actions2 = self.decide_actions([(c2, c1) for (c1, c2) in interactions],
+                                       memory)
+        
+        if stats is not None:
+            stats.stop()
+            stats.start('payoffs')
+        
+        #scatter-add the payoffs, keeping first-seen order
+        slots = dict()
+        participants = list()
+        totals = list()
+        for (c1, c2), a1, a2 in izip(interactions, actions1, actions2):
+            for critter, food in ((c1, payoffs[a1][a2]), (c2, payoffs[a2][a1])):
+                slot = slots.get(critter)
+                if slot is None:
+                    slots[critter] = len(totals)
+                    participants.append(critter)
+                    totals.append(food)
+                else:
+                    totals[slot] += food
+        
+        for critter, food in izip(participants, totals):
+            critter.add_food(food)
+        
+        #Critters and plugins observe the outcomes
+        if stats is not None:
+            stats.stop()
+            stats.start('observations')
+        observed = self.subscribers['on_interaction_end']
+        shared = memory is not None
+        if shared:
+            record = memory.record
+        for (c1, c2), a1, a2 in izip(interactions, actions1, actions2):
+            strategy1 = c1.strategy
+            strategy2 = c2.strategy
+            if strategy1.kernel is None:
+                if shared and strategy1.reactions is not None:
+                    record(c1.id, c2.id, a2)
+                else:
+                    c1.observe_interaction(c1, a1, c2, a2)
+            if strategy2.kernel is None:
+                if shared and strategy2.reactions is not None:
+                    record(c2.id, c1.id, a1)
+                else:
+                    c2.observe_interaction(c1, a1, c2, a2)
+            if observed:
+                self.send_interaction_end(environment, c1, a1, c2, a2)
+        
+        if stats is not None:
+            stats.stop()
+        
+        return actions1, actions2
+    
+    def decide_actions(self, pairs, memory=None):
+        '''
+        returns the action of the first critter of each pair towards the 
+        second. Stateless strategies are decided from their kernels without 
+        being called: fixed actions are copied and cooperation chances are 
+        settled with a draw from the world's generator. Given a pairwise 
+        memory, reactive strategies are decided by looking up their partner's
+        state in it. Every other strategy is asked in turn
+        >>> world = PrisonersDilemmaWorld(seed=1)
+        >>> c1 = critters.Critter('c1', strategies.CheatStrategy())
+        >>> s1 = critters.Critter('s1', strategies.SuckerStrategy())
+        >>> t1 = critters.Critter('t1', strategies.TitForTatStrategy())
+        >>> world.decide_actions([(c1, s1), (s1, c1), (t1, c1)])
+        [0, 1, 1]
+        >>> r1 = critters.Critter('r1', strategies.RandomStrategy(1))
+        >>> actions = world.decide_actions([(r1, c1)] * 1000)
+        >>> 400 < sum(actions) < 600
+        True
+        '''
+        cooperate = strategies.COOPERATE
+        uncooperate = strategies.UNCOOPERATE
+        draw = self.random.random
+        
+        actions = list()
+        append = actions.append
+        shared = memory is not None
+        if shared:
+            states = memory.states.get
+            shift = memory.KEY_BITS
+        for critter, partner in pairs:
+            strategy = critter.strategy
+            kernel = strategy.kernel
+            if kernel is None:
+                reactions = strategy.reactions
+                if shared and reactions is not None:
+                    append(reactions[states(critter.id << shift | partner.id,
+                                            0)])
+                else:
+                    append(strategy.interact(partner))
+            elif kernel == 0.0:
+                append(uncooperate)
+            elif kernel == 1.0:
+                append(cooperate)
+            elif draw() <= kernel:
+                append(cooperate)
+            else:
+                append(uncooperate)
+        return actions
 
     
 if __name__ == '__main__':